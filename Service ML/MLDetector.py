@@ -4,17 +4,31 @@ import time
 import datetime
 import subprocess
 import joblib
+import numpy as np
 import pandas as pd
 import requests
 import sys
 import shutil
+import heapq
+from feature_ring import FeatureRingReader, u32_to_ip
+from feature_channel import FeatureSubscriber
+from feature_segments import segments_since, CsvTail, MANIFEST
+from async_log import AsyncLogger, epoch_format, raw_format, DEBUG, INFO
 
 # ============ KONFIGURASI ============
 UFW_BIN = shutil.which("ufw") or "/usr/sbin/ufw"
 MODEL_PATH = "/home/pros/model/rf_model_TOP_17.pkl"
 SCALER_PATH = "/home/pros/model/scaler_TOP_17.pkl"
-CACHE_CSV = "/home/pros/dataML/features_ML_fuel_TOP_17_ROUND_2.csv"
+FEATURE_SEGMENTS = "/home/pros/dataML/features"   # segment CSV + manifest dari PCAPWorker (jika ring belum ada)
+CACHE_CSV = "/home/pros/dataML/features_ML_fuel_TOP_17_ROUND_2.csv"   # CSV lama satu file, jika belum ada manifest
+FEATURE_RING = "/home/pros/dataML/features_ring.bin"   # binary feature log dari PCAPWorker
+USE_RING = True          # baca ring dulu, CSV hanya jika ring belum ada
+FEATURE_SOCKET = "/home/pros/dataML/ml_features.sock"  # push channel dari PCAPWorker ("" = off)
 LOG_FILE = "/home/pros/dataML/log/testing.log"
+LOG_LEVEL = "INFO"
+LOG_MAX_BYTES = 20 * 1024 * 1024   # rotasi testing.log
+LOG_BACKUPS = 3
+LOG_RATE_INTERVAL = 30.0  # detik, baris [ML] per IP yang labelnya sama ditulis sekali per interval
 
 # file epoch-prefix untuk parser otomatis
 EPOCH_LOG = "/home/pros/dataML/log/ml_detector_epoch.log"
@@ -26,31 +40,28 @@ CHAT_ID = ""
 WHITELIST_IPS = ["192.168.67.14"]  # IP VM monitoring (skip ML)
 BAN_DURATION = 5         # detik
 CHECK_INTERVAL = 1       # detik
-MAX_FEATURE_AGE = 300    # detik
+MAX_FEATURE_AGE = 300    # detik, umur fitur dihitung dari paket terakhir flow (flow_end), bukan waktu proses
+MAX_CACHE_ROWS = 200000  # flow id yang diingat untuk dedupe paling banyak (yang terbaru menurut flow_end)
+WORKER_LAG_WARN = 60     # detik, peringatan jika watermark PCAPWorker tertinggal sejauh ini
 THRESHOLD = 0.50         # prob threshold
+# PCAPWorker overload (flood): flows are cut early and look like short
+# connections, so ask for more confidence before banning on them
+DEGRADED_THRESHOLD = 0.70
+WORKER_STATUS_MAX_AGE = 30   # detik, a degraded status not repeated for this long is dropped
 # =====================================
 
 
 # ============ LOGGING ============
-def log(msg):
-    now = time.time()
-    ts = datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S.%f")
-    epoch = f"{now:.6f}"
-    text = f"[{epoch}][{ts}] {msg}"
-    print(text)
-    try:
-        with open(LOG_FILE, "a") as f:
-            f.write(text + "\n")
-    except:
-        pass
+_logger = AsyncLogger(LOG_FILE, level=LOG_LEVEL, formatter=epoch_format,
+                      max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS, rate_interval=LOG_RATE_INTERVAL)
+# epoch log dibaca parser otomatis: tidak di-rate-limit, tanpa rotasi, tidak di-print
+_epoch_logger = AsyncLogger(EPOCH_LOG, level=DEBUG, formatter=raw_format, echo=False, max_bytes=0)
+
+def log(msg, key=None, every=None):
+    _logger.log(msg, key=key, every=every)
 
 def write_epoch_log(epoch, msg):
-    line = f"{int(epoch)} {msg}\n"
-    try:
-        with open(EPOCH_LOG, "a") as f:
-            f.write(line)
-    except:
-        log("[WARN] gagal tulis epoch_log")
+    _epoch_logger.log(f"{int(epoch)} {msg}", INFO)
 
 def append_events_local(epoch, ip, prob, label):
     try:
@@ -87,8 +98,20 @@ print("[OK] Model dimuat")
 send_telegram("🤖 ML Detector aktif!")
 
 banned_ips = {}
-_cache_df = None
+_degraded = False
+_last_event = {}   # ip -> flow_end of the row last evaluated for it
+_latest = {}       # ip -> (flow_end, timestamp, feature vector) of its newest port-22 row
+_seen_flows = set()  # FLOW_ID tuples of rows already taken, for dedupe
+_seen_order = []     # heap of (flow_end, flow id), prunes _seen_flows by age
 _cache_mtime = 0
+_csv_tails = {}   # path -> CsvTail, CSV files read incrementally (fallback without ring)
+_ring = FeatureRingReader(FEATURE_RING, from_start=True) if USE_RING else None
+_channel = None
+if FEATURE_SOCKET:
+    try:
+        _channel = FeatureSubscriber(FEATURE_SOCKET)
+    except OSError as e:
+        log(f"[WARN] push channel {FEATURE_SOCKET} tidak aktif: {e}")
 
 FEATURE_COLS = [
     "destination port",
@@ -109,43 +132,211 @@ FEATURE_COLS = [
     "flow iat max",
     "down/up ratio"
 ]
+# urutan kolom mengikuti model yang dimuat (mis. model 7 fitur)
+if hasattr(scaler, "feature_names_in_"):
+    FEATURE_COLS = [str(c) for c in scaler.feature_names_in_]
+elif hasattr(model, "feature_names_in_"):
+    FEATURE_COLS = [str(c) for c in model.feature_names_in_]
+# kolom SSH-Patator di predict_proba, dicari sekali (None = pakai predict)
+try:
+    PATATOR_IDX = list(model.classes_).index("SSH-Patator") if hasattr(model, "predict_proba") else None
+except (AttributeError, ValueError):
+    PATATOR_IDX = None
 
 
 # ============ CACHE HANDLING ============
+# Rows are aged, ordered and deduplicated on event time: flow_end is the
+# flow's last packet. A row the worker emits twice (ring + push, restart,
+# re-extracted archive) has the same (src_ip, dst_ip, flow_start, flow_end).
+FLOW_ID = ["src_ip", "dst_ip", "flow_start", "flow_end"]
+
+def with_event_time(df):
+    """CSV files from before flow_start/flow_end only have the processing time."""
+    for c in ("flow_start", "flow_end"):
+        if c not in df.columns:
+            df[c] = df["timestamp"]
+    return df
+
+def ingest_records(recs, names):
+    """Add feature records (feature_ring dtype) to the cache. Rows older
+    than MAX_FEATURE_AGE in event time and rows already cached are dropped.
+    Returns the source IPs of the rows that were added."""
+    if not len(recs):
+        return []
+    late = recs["flow_end"] < time.time() - MAX_FEATURE_AGE
+    if late.any():
+        log(f"[debug] {int(late.sum())} baris fitur terlambat (flow_end > {MAX_FEATURE_AGE}s lalu) diabaikan",
+            key="late")
+        recs = recs[~late]
+        if not len(recs):
+            return []
+    new = pd.DataFrame({c: recs[c] for c in names})
+    ips = {v: u32_to_ip(v) for v in set(recs["src_ip"].tolist()) | set(recs["dst_ip"].tolist())}
+    new["src_ip"] = [ips[v] for v in recs["src_ip"].tolist()]
+    new["dst_ip"] = [ips[v] for v in recs["dst_ip"].tolist()]
+    for c in ("flow_start", "flow_end", "timestamp"):
+        new[c] = recs[c]
+    return add_rows(new)
+
+def add_rows(new):
+    """Index rows whose flow id was not seen yet; returns their source IPs.
+    Only the flow ids are kept, the cost is per new row."""
+    new = new.drop_duplicates(FLOW_ID)
+    ids = list(zip(*(new[c].tolist() for c in FLOW_ID)))
+    fresh = [i not in _seen_flows for i in ids]
+    if not all(fresh):
+        new = new[fresh]
+        ids = [i for i, f in zip(ids, fresh) if f]
+    for i in ids:
+        _seen_flows.add(i)
+        heapq.heappush(_seen_order, (i[3], i))
+    index_latest(new)
+    return new["src_ip"].unique().tolist()
+
+def index_latest(new):
+    """Update _latest with rows just added to the cache, so a lookup per IP
+    is a dict get. Newest = latest flow_end (event time), then
+    timestamp, not arrival order (backlog / late rows)."""
+    if new.empty or "destination port" not in new.columns:
+        return
+    rows = new[new["destination port"] == 22]
+    if rows.empty:
+        return
+    rows = rows.sort_values(["flow_end", "timestamp"], kind="stable").drop_duplicates("src_ip", keep="last")
+    X = rows.reindex(columns=FEATURE_COLS, fill_value=0.0).to_numpy(dtype=float)
+    for ip, end, ts, x in zip(rows["src_ip"].tolist(), rows["flow_end"].tolist(), rows["timestamp"].tolist(), X):
+        cur = _latest.get(ip)
+        if cur is None or (end, ts) >= cur[:2]:
+            _latest[ip] = (end, ts, x)
+
+def prune_cache():
+    cutoff = time.time() - MAX_FEATURE_AGE
+    while _seen_order and (_seen_order[0][0] < cutoff or len(_seen_order) > MAX_CACHE_ROWS):
+        _seen_flows.discard(heapq.heappop(_seen_order)[1])
+    for ip, t in list(_last_event.items()):
+        if t < cutoff:
+            del _last_event[ip]
+    for ip, (end, _ts, _x) in list(_latest.items()):
+        if end < cutoff:
+            del _latest[ip]
+
+def check_worker_lag():
+    """The ring watermark says how far (in capture time) PCAPWorker got."""
+    if _ring is None:
+        return
+    wm = _ring.watermark()
+    if wm and time.time() - wm > WORKER_LAG_WARN:
+        log(f"[WARN] PCAPWorker tertinggal {time.time() - wm:.0f}s (watermark {int(wm)}), "
+            f"fitur yang lebih tua dari {MAX_FEATURE_AGE}s diabaikan", key="worker-lag")
+
+def load_ring():
+    """Append new ring records to the cache, keep only the last MAX_FEATURE_AGE s.
+    Returns False if there is no ring (caller falls back to CSV)."""
+    recs = _ring.read_new()
+    if recs is None:
+        return False
+    ingest_records(recs, _ring.feature_names)
+    prune_cache()
+    return True
+
+def ingest_push(batches):
+    """Records pushed by PCAPWorker. The ring sequence numbers make sure
+    nothing is added twice and gaps are filled from the ring."""
+    touched = set()
+    for seq, recs, names in batches:
+        have_ring = _ring is not None and _ring.mm is not None
+        if seq is not None and have_ring:
+            if seq + len(recs) <= _ring.read_seq:
+                continue                  # sudah dibaca dari ring
+            if seq > _ring.read_seq:
+                load_ring()               # ada yang terlewat, ring berisi batch ini juga
+                touched.update(u32_to_ip(v) for v in set(recs["src_ip"].tolist()))
+                continue
+            skip = _ring.read_seq - seq
+            _ring.read_seq = seq + len(recs)
+            recs = recs[skip:]
+        touched.update(ingest_records(recs, names))
+    return touched
+
+def read_csv_tails(paths):
+    """Add the rows appended to these CSV files since the last call; files
+    no longer in `paths` (retired segments) are forgotten."""
+    for p in list(_csv_tails):
+        if p not in paths:
+            del _csv_tails[p]
+    for p in paths:
+        tail = _csv_tails.get(p)
+        if tail is None:
+            tail = _csv_tails[p] = CsvTail(p)
+        try:
+            df = tail.read_new()
+        except Exception as e:
+            log(f"[WARN] gagal baca {p}: {e}")
+            continue
+        if df is None or df.empty:
+            continue
+        df = with_event_time(df)
+        add_rows(df[df["flow_end"] >= time.time() - MAX_FEATURE_AGE])
+
+def load_segments():
+    """CSV fallback: tail the segments with events inside MAX_FEATURE_AGE
+    whenever the worker updates the manifest. Returns False if
+    FEATURE_SEGMENTS has no manifest."""
+    global _cache_mtime
+    try:
+        mtime = os.path.getmtime(os.path.join(FEATURE_SEGMENTS, MANIFEST))
+    except OSError:
+        return False
+    if mtime != _cache_mtime:
+        _cache_mtime = mtime
+        try:
+            read_csv_tails(segments_since(FEATURE_SEGMENTS, time.time() - MAX_FEATURE_AGE) or [])
+        except Exception as e:
+            log(f"[WARN] gagal baca segment fitur: {e}")
+        prune_cache()
+    return True
+
 def load_cache():
-    global _cache_df, _cache_mtime
+    global _cache_mtime
+    if _ring is not None and load_ring():
+        return
+    if load_segments():
+        return
     try:
         mtime = os.path.getmtime(CACHE_CSV)
-    except:
+    except OSError:
         return
-    if _cache_df is None or mtime != _cache_mtime:
-        try:
-            _cache_df = pd.read_csv(CACHE_CSV)
-            _cache_mtime = mtime
-        except:
-            log("[WARN] gagal baca cache")
+    if mtime != _cache_mtime:
+        _cache_mtime = mtime
+        read_csv_tails([CACHE_CSV])
+        prune_cache()
 
 def get_latest_features_for_ip(ip):
-    load_cache()
-    global _cache_df
-    if _cache_df is None or _cache_df.empty:
-        return None, None
-
-    df_ip = _cache_df[
-        (_cache_df["src_ip"] == ip) &
-        (_cache_df.get("destination port", 0) == 22)
-    ]
-
-    if df_ip.empty:
-        return None, None
-
-    latest = df_ip.sort_values("timestamp", ascending=False).iloc[0]
-    age = time.time() - float(latest["timestamp"])
-    if age > MAX_FEATURE_AGE:
-        return None, None
-
-    feats = [float(latest[c]) if c in latest else 0.0 for c in FEATURE_COLS]
-    return feats, FEATURE_COLS
+    """Feature vector of the IP's newest port-22 row from the index, or
+    Nones if it has none younger than MAX_FEATURE_AGE."""
+    entry = _latest.get(ip)
+    if entry is None:
+        return None, None, None
+    event_ts, _ts, feats = entry
+    if time.time() - event_ts > MAX_FEATURE_AGE:
+        return None, None, None
+    return feats, FEATURE_COLS, event_ts
+
+
+def update_worker_status():
+    """Degraded state reported by PCAPWorker over the push channel."""
+    global _degraded
+    now = time.time()
+    states = _channel.worker_status() if _channel is not None else []
+    degraded = [s for s in states if s.get("degraded") and now - s.get("time", 0) < WORKER_STATUS_MAX_AGE]
+    if bool(degraded) != _degraded:
+        _degraded = bool(degraded)
+        if _degraded:
+            s = degraded[0]
+            log(f"[WARN] PCAPWorker overload: {s.get('flows_open')} flows, sampling 1/{s.get('sample_every', 1)}, "
+                f"threshold {DEGRADED_THRESHOLD:.2f}")
+        else:
+            log(f"[INFO] PCAPWorker back to normal, threshold {THRESHOLD:.2f}")
 
 
 # ============ FIREWALL ============
@@ -185,56 +376,78 @@ def check_unban():
             unban_ip(ip)
 
 
-# ================== MAIN LOOP ==================
-while True:
-    try:
-        load_cache()
-
-        if _cache_df is not None and not _cache_df.empty:
-            for ip in _cache_df["src_ip"].unique():
-
-                # ========== WHITELIST — SKIP ML ==========
-                if ip in WHITELIST_IPS:
-                    log(f"[WHITELIST] Skipping ML for whitelisted IP {ip}")
-                    write_epoch_log(int(time.time()), f"[WHITELIST] skip {ip}")
-                    continue
-                # ==========================================
-
-                data = get_latest_features_for_ip(ip)
-                if data[0] is None:
-                    continue
+def score(X):
+    """P(SSH-Patator) for every row of X (n x FEATURE_COLS): one
+    scaler.transform and one predict_proba call for the whole batch."""
+    X_scaled = scaler.transform(pd.DataFrame(X, columns=FEATURE_COLS))
+    if PATATOR_IDX is None:
+        return (model.predict(X_scaled) == "SSH-Patator").astype(float)
+    return model.predict_proba(X_scaled)[:, PATATOR_IDX]
+
+def evaluate_ips(ips, only_newer=False):
+    batch, rows = [], []
+    for ip in ips:
+        # ========== WHITELIST — SKIP ML ==========
+        if ip in WHITELIST_IPS:
+            log(f"[WHITELIST] Skipping ML for whitelisted IP {ip}", key=("whitelist", ip))
+            write_epoch_log(int(time.time()), f"[WHITELIST] skip {ip}")
+            continue
+        # ==========================================
+
+        feats, _cols, event_ts = get_latest_features_for_ip(ip)
+        if feats is None:
+            continue
+        if only_newer and event_ts <= _last_event.get(ip, 0.0):
+            continue   # push berisi baris lama / duplikat, keputusan IP ini tidak berubah
+        _last_event[ip] = max(event_ts, _last_event.get(ip, 0.0))
+        batch.append(ip)
+        rows.append(feats)
+    if not batch:
+        return
 
-                feats, cols = data
-                X_df = pd.DataFrame([feats], columns=cols)
-                X_scaled = scaler.transform(X_df)
+    # semua IP sekaligus dalam satu matriks
+    probs = score(np.vstack(rows))
+    threshold = DEGRADED_THRESHOLD if _degraded else THRESHOLD
+    now_epoch = int(time.time())
 
-                try:
-                    idx = list(model.classes_).index("SSH-Patator")
-                except:
-                    idx = None
+    for ip, prob in zip(batch, probs.tolist()):
+        label = "SSH-Patator" if prob >= threshold else "BENIGN"
+        log(f"[ML] {ip} => {label} (prob={prob:.2f}){' [degraded]' if _degraded else ''}", key=("ml", ip, label))
+        write_epoch_log(now_epoch, f"[ML] {ip} => {label} (prob={prob:.2f})")
+        append_events_local(now_epoch, ip, prob, label)
 
-                if idx is None:
-                    pred = model.predict(X_scaled)[0]
-                    prob = 1.0 if pred == "SSH-Patator" else 0.0
-                else:
-                    prob = model.predict_proba(X_scaled)[0][idx]
+        if label == "SSH-Patator":
+            ban_ip(ip, prob)
 
-                label = "SSH-Patator" if prob >= THRESHOLD else "BENIGN"
 
-                now_epoch = int(time.time())
+# ================== MAIN LOOP ==================
+last_tick = 0.0
+while True:
+    try:
+        if _channel is not None:
+            # event loop: fitur yang di-push langsung dievaluasi,
+            # tick penuh tetap jalan tiap CHECK_INTERVAL
+            batches = _channel.poll(last_tick + CHECK_INTERVAL - time.time())
+            update_worker_status()
+            if batches:
+                evaluate_ips(ingest_push(batches), only_newer=True)
+            if time.time() - last_tick < CHECK_INTERVAL:
+                continue
+        last_tick = time.time()
 
-                log(f"[ML] {ip} => {label} (prob={prob:.2f})")
-                write_epoch_log(now_epoch, f"[ML] {ip} => {label} (prob={prob:.2f})")
-                append_events_local(now_epoch, ip, prob, label)
+        load_cache()
 
-                if label == "SSH-Patator":
-                    ban_ip(ip, prob)
+        evaluate_ips(list(_latest))
 
         check_unban()
-        time.sleep(CHECK_INTERVAL)
+        check_worker_lag()
+        if _channel is None:
+            time.sleep(CHECK_INTERVAL)
 
     except KeyboardInterrupt:
         log("[STOP] dihentikan user")
+        if _channel is not None:
+            _channel.close()
         send_telegram("🛑 ML Detector dimatikan")
         break
     except Exception as e:
@@ -1,25 +1,127 @@
 #!/usr/bin/env python3
 # PCAPWorker.py  -- robust pcap -> feature CSV worker with debug/logging
 import os
+import sys
 import time
+import select
+import signal
+import atexit
+import argparse
 import traceback
-from scapy.utils import PcapReader
-from scapy.layers.inet import IP, TCP
-from collections import defaultdict
-import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+from pcap_reader import (iter_ssh_packets_data, iter_ssh_packets_scapy,
+                         parse_global_header, read_capture, UnsupportedPcap, PcapStream, PcapTail)
+from pcap_archive import PcapArchive, list_captures
+from flow_table import FlowTable
+from feature_registry import FeaturePlan, load_plan
+from dir_watcher import InotifyWatcher, InotifyUnavailable, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE, IN_MODIFY
+from processed_store import ProcessedCheckpoint, rotation_stamp
+from feature_segments import SegmentWriter
+from flow_snapshot import save_snapshot, load_snapshot, restore_table, SnapshotError
+from feature_ring import FeatureRingWriter, rows_to_records
+from feature_channel import FeaturePublisher
+from async_log import AsyncLogger
+from worker_metrics import (Metrics, serve_http, start_json_snapshots,
+                            LAG_BUCKETS, COUNT_BUCKETS)
 
 PCAP_DIR = "/home/pros/pcap/rotated"
-OUT_CSV = "/home/pros/dataML/features_ML_fuel_TOP_20.csv"   # cache CSV used by ML detector
-PROCESSED_LIST = "/home/pros/pcap/log/pcap_processed.list"
+FEATURE_DIR = "/home/pros/dataML/features"   # per-minute CSV segments + manifest.json (CSV-mode detector, training)
+FEATURE_RING = "/home/pros/dataML/features_ring.bin"        # binary feature log read by MLDetector
+RING_CAPACITY = 65536      # records kept in the ring
+WRITE_CSV = True           # write the CSV segments too
+SEGMENT_SECONDS = 60       # one CSV per minute (processing time)
+SEGMENT_RETAIN = 900       # detik of event time a segment stays in FEATURE_DIR (>= MLDetector MAX_FEATURE_AGE)
+SEGMENT_ARCHIVE = "/home/pros/dataML/features_archive"   # older segments, compressed, for training ("" = delete)
+FEATURE_SOCKET = "/home/pros/dataML/ml_features.sock"    # MLDetector push channel ("" = off)
+PROCESSED_LIST = "/home/pros/pcap/log/pcap_processed.list"   # legacy, migrated once
+CHECKPOINT = "/home/pros/pcap/log/pcap_checkpoint.json"
 WORKER_LOG = "/home/pros/pcap/log/worker.log"
+LOG_LEVEL = "DEBUG"        # "INFO" hides the per-file [debug] lines
+LOG_MAX_BYTES = 10 * 1024 * 1024   # rotate worker.log at this size
+LOG_BACKUPS = 3
+LOG_RATE_INTERVAL = 60.0   # detik between repeats of a rate-limited line
+
+# Metrics: Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics and a
+# JSON snapshot file the Monitor VM can read over SSH
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108        # 0 = no HTTP endpoint
+METRICS_JSON = "/home/pros/pcap/log/worker_metrics.json"   # "" = no snapshot file
+METRICS_JSON_INTERVAL = 10.0
+
+# TCP server ports to extract flows for; everything else is dropped by the
+# header prefilter in pcap_reader. Add e.g. 2222 or 443 to track more services.
+WATCH_PORTS = (22,)
+
+# Overload protection (SYN / connection floods): the flow table holds at most
+# MAX_FLOWS flows (~0.5 KB each); at the cap the least recently active flow is
+# emitted early as a partial row and only 1 in SAMPLE_EVERY new connections is
+# tracked until the table drains. The detector is told while this is going on.
+MAX_FLOWS = 100000         # 0 = unbounded
+SAMPLE_EVERY = 16          # 0/1 = no sampling, eviction only
+STATUS_INTERVAL = 5.0      # detik, repeat the degraded status to the detector
+
+# Archive: processed captures are moved out of PCAP_DIR, compressed, into
+# ARCHIVE_DIR/YYYYmmdd/ (re-extract with --extract). Oldest files are deleted
+# once the archive is larger than ARCHIVE_BUDGET.
+ARCHIVE_DIR = "/home/pros/pcap/archive"   # "" = leave files to tcpdump's -W ring
+ARCHIVE_CODEC = "zstd"     # "zstd" (pip install zstandard) or "gzip"; zstd falls back to gzip
+ARCHIVE_LEVEL = 3
+ARCHIVE_BUDGET = 2 * 1024 ** 3   # bytes, 0 = no limit
+ARCHIVE_DRAIN = 5.0        # detik to finish queued files on shutdown
+
+# Restart state: open flows, the processed-file commit count and the follow
+# offset are snapshotted to STATE_SNAPSHOT (binary, atomic rename) at the end
+# of every loop turn that committed files or published rows (right after the
+# processed checkpoint is written), otherwise every SNAPSHOT_INTERVAL, and
+# restored on start: a restart neither cuts open connections in two nor
+# re-reads files. A snapshot is only used at the checkpoint's commit count,
+# so a turn that committed files always takes one; while the flow table is
+# overloaded, turns that only published rows wait for SNAPSHOT_INTERVAL
+# (snapshots cost ~1 s per 100k flows). Rows published after the last
+# snapshot (a crash mid-turn, or overload) can come out again after a
+# crash; MLDetector drops the repeats by flow_start/flow_end.
+STATE_SNAPSHOT = "/home/pros/pcap/log/worker_state.bin"   # "" = off, flows are flushed on stop
+SNAPSHOT_INTERVAL = 5.0    # detik
 
 # Safety tuning
 MIN_FILE_SIZE = 200        # bytes, skip files smaller than this
 STALE_SECONDS = 1.0        # only process file if not modified in last N seconds
 SLEEP_AFTER_DETECT = 0.5   # wait before reading new file (give tcpdump a moment)
+CAPTURE_LAG = 5.0          # tcpdump -G rotation; wall-clock expiry waits this much longer
+USE_INOTIFY = True         # event-driven watcher; falls back to polling if unavailable
+POLL_INTERVAL = 1.0        # polling fallback period / inotify wait timeout
+RESCAN_INTERVAL = 60.0     # safety listdir rescan while using inotify
+PARALLEL_WORKERS = min(4, os.cpu_count() or 1)  # pool size for backlog catch-up, 1 = serial
+MAX_INFLIGHT = 2 * PARALLEL_WORKERS             # files submitted but not yet committed
 
-# === Top20 feature order (must match training order) ===
+# Backlog after downtime: when the oldest ready file was closed more than
+# BACKLOG_LAG ago (restart, long stall), the newest LIVE_EDGE_FILES ready
+# files (and all later ones) are the live edge and are handled first; older
+# files drain oldest-first in a background lane, in slices between live work.
+# A smaller burst (a few rotations in one wait) stays in the live table.
+LIVE_EDGE_FILES = 2        # rotation files treated as live when a backlog is found
+BACKLOG_LAG = 60.0         # detik behind the wall clock before a batch counts as backlog
+BACKLOG_NICE = 10          # nice increment of the pool workers (only the backlog uses the pool)
+BACKLOG_SLICE = 0.2        # detik of backlog work per loop turn without a pool
+BACKLOG_WAIT = 0.05        # detik, event wait while the backlog lane has work
+
+# Live mode (--live): pcap stream from `tcpdump -U -w -` on stdin or a FIFO
+LIVE_TICK = 0.2            # select timeout, also how often idle/closed flows are checked
+LIVE_CLOSE_LINGER = 0.2    # wait for the last ACK after FIN/FIN (LAN RTT is ms)
+LIVE_READ_SIZE = 1 << 16
+
+# Follow mode (--follow): tail the rotation file tcpdump is still writing
+FOLLOW_TICK = 0.5          # max wait between reads when no inotify event arrives
+
+# Extraction plan: only the features the deployed model consumes are computed.
+# Taken from FEATURE_SCHEMA, else <MODEL_PATH stem>.features.json, else the
+# model's feature_names_in_ (needs joblib), else FEATURE_ORDER below.
+MODEL_PATH = "/home/pros/model/rf_model_TOP_17.pkl"
+FEATURE_SCHEMA = ""
+
+# === Top20 feature order (must match training order), default plan ===
 FEATURE_ORDER = [
     "destination port",
     "flow bytes/s",
@@ -41,164 +143,208 @@ FEATURE_ORDER = [
     # bookkeeping
     "src_ip",
     "dst_ip",
-    "timestamp"
+    "flow_start",   # first / last packet time of the flow (event time)
+    "flow_end",
+    "timestamp"     # when the row was made
 ]
 # =======================================================
+PLAN = FeaturePlan(FEATURE_ORDER)
 
-def log(msg):
-    ts = time.strftime("%Y-%m-%d %H:%M:%S")
-    text = f"[{ts}] {msg}"
-    print(text, flush=True)
+def init_plan():
+    """Resolve the extraction plan for the configured model; FEATURE_ORDER
+    becomes the plan's columns (ring, push channel and CSV use it)."""
+    global PLAN, FEATURE_ORDER
     try:
-        os.makedirs(os.path.dirname(WORKER_LOG), exist_ok=True)
-        with open(WORKER_LOG, "a") as f:
-            f.write(text + "\n")
-    except Exception:
-        pass
+        PLAN, source = load_plan(MODEL_PATH, FEATURE_SCHEMA, default=FEATURE_ORDER)
+    except Exception as e:
+        log(f"[WARN] cannot build feature plan ({e}), using the default {len(PLAN.names)} features")
+        return
+    FEATURE_ORDER = PLAN.columns
+    log(f"[INFO] extracting {len(PLAN.names)} features from {source}")
+
+_logger = None
+
+def log(msg, key=None, every=None):
+    """Queue a log line (written by a background thread). Lines with a `key`
+    are rate limited to one per `every` seconds (LOG_RATE_INTERVAL)."""
+    global _logger
+    if _logger is None:
+        _logger = AsyncLogger(WORKER_LOG, level=LOG_LEVEL, max_bytes=LOG_MAX_BYTES,
+                              backups=LOG_BACKUPS, rate_interval=LOG_RATE_INTERVAL)
+    _logger.log(msg, key=key, every=every)
+
+METRICS = Metrics("pcapworker")
+METRICS.describe("stage_seconds", "time spent per pipeline stage call (read, parse, aggregate, features, output)")
+METRICS.describe("capture_lag_seconds", "row timestamp minus capture time of the flow's last packet")
+METRICS.describe("file_packets", "watched packets per pcap file")
+METRICS.describe("file_flows", "feature rows written per pcap file")
+METRICS.describe("file_lag_seconds", "file mtime to checkpoint, how far behind tcpdump the worker is")
+METRICS.describe("packets_total", "watched packets parsed")
+METRICS.describe("rows_total", "feature rows published")
+METRICS.describe("flows_open", "flows currently held in the flow table")
+METRICS.describe("files_backlog", "live-edge files ready to process in the current batch")
+METRICS.describe("backlog_files", "historical files queued or in flight in the backlog lane")
+METRICS.describe("flows_estimated_total", "finished connections, sampled ones scaled by the sampling rate")
+METRICS.describe("flows_partial_total", "flows cut early by the MAX_FLOWS cap")
+METRICS.describe("packets_shed_total", "packets of connections skipped by overload sampling")
+METRICS.describe("watermark_lag_seconds", "wall clock minus the event-time watermark published in the ring")
+METRICS.describe("overloaded", "1 while the flow table is at its cap (evicting / sampling)")
+METRICS.describe("snapshot_bytes", "size of the last flow state snapshot")
+METRICS.describe("segments_retired_total", "feature CSV segments moved out of FEATURE_DIR")
+METRICS.describe("archive_bytes", "compressed captures kept in ARCHIVE_DIR")
+METRICS.describe("archive_evicted_total", "archived captures deleted to stay within ARCHIVE_BUDGET")
+
+_stop = False   # set by SIGTERM/SIGINT, checked between file commits and loop turns
+
+def stop_on_signals():
+    """systemd stops the service with SIGTERM, a terminal with Ctrl-C. Both
+    only set the stop flag: the loops finish the file they are committing
+    and the current turn, then take the shutdown path (final state
+    snapshot, archive drain), so the snapshot never holds a half-read
+    file. A repeated signal is ignored."""
+    def handler(signum, frame):
+        global _stop
+        if not _stop:
+            _stop = True
+            log(f"[worker] {signal.Signals(signum).name} received, shutting down")
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+def init_pool_worker(nice):
+    # pool workers are stopped by the parent, not by its signal handlers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.nice(nice)
+
+def start_metrics():
+    if METRICS_PORT:
+        try:
+            serve_http(METRICS, METRICS_HOST, METRICS_PORT)
+            log(f"[INFO] metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            log(f"[WARN] metrics endpoint not started: {e}")
+    if METRICS_JSON:
+        start_json_snapshots(METRICS, METRICS_JSON, METRICS_JSON_INTERVAL,
+                             on_error=lambda e: log(f"[WARN] metrics snapshot failed: {e}", key="metrics-json"))
+
+_archive = None
+
+def start_archive():
+    global _archive
+    if not ARCHIVE_DIR:
+        return
+    try:
+        _archive = PcapArchive(ARCHIVE_DIR, ARCHIVE_BUDGET, ARCHIVE_CODEC, ARCHIVE_LEVEL,
+                               on_error=archive_failed, on_done=archive_done)
+    except OSError as e:
+        log(f"[WARN] archive disabled, cannot use {ARCHIVE_DIR}: {e}")
+        return
+    if _archive.codec != ARCHIVE_CODEC:
+        log(f"[WARN] {ARCHIVE_CODEC} not available, archiving with {_archive.codec}")
+    METRICS.set("archive_bytes", _archive.bytes)
+    budget = f"{ARCHIVE_BUDGET / 1e6:.0f} MB" if ARCHIVE_BUDGET else "no limit"
+    log(f"[INFO] archiving to {ARCHIVE_DIR} ({_archive.codec}, {len(_archive)} files, "
+        f"{_archive.bytes / 1e6:.1f} MB, budget {budget})")
+
+def archive_done(path, raw, packed, evicted):
+    # runs on the archive thread
+    METRICS.inc("archive_files_total")
+    METRICS.inc("archive_raw_bytes_total", raw)
+    METRICS.inc("archive_written_bytes_total", packed)
+    METRICS.set("archive_bytes", _archive.bytes)
+    if evicted:
+        METRICS.inc("archive_evicted_total", evicted)
+        log(f"[debug] archive over budget, deleted {evicted} oldest captures", key="archive-evict")
+
+def archive_failed(path, e):
+    METRICS.inc("errors_total", stage="archive")
+    log(f"[WARN] cannot archive {path}: {e}", key="archive-error")
+
+def stop_archive():
+    if _archive is not None and not _archive.drain(ARCHIVE_DRAIN):
+        log(f"[WARN] {_archive.pending()} captures left unarchived, they are queued again next start")
 
 def safe_read_pcap(pcap_path):
     try:
-        with PcapReader(pcap_path) as rdr:
-            try:
-                first = next(iter(rdr))
-            except Exception:
-                pass
+        with open(pcap_path, "rb") as f:
+            head = f.read(24)
+        try:
+            parse_global_header(head)
+        except UnsupportedPcap:
+            from scapy.utils import PcapReader
+            with PcapReader(pcap_path) as rdr:
+                try:
+                    first = next(iter(rdr))
+                except Exception:
+                    pass
     except Exception as e:
         log(f"[WARN] safe_read_pcap: cannot open {pcap_path}: {e}")
         return False
     return True
 
-def process_pcap_file(pcap_path):
-    flows = defaultdict(list)  # key=(client_ip, server_ip, server_port)
+def flow_to_row(flow, now_ts):
+    """Feature row from a FlowTable record's running accumulators."""
+    return PLAN.row(flow, now_ts)
+
+def rows_from_flows(flows):
+    """Feature rows for finished FlowTable flows (one row per connection)."""
+    if not flows:
+        return []
+    now_ts = time.time()
+    with METRICS.stage("features"):
+        rows = [flow_to_row(flow, now_ts) for flow in flows]
+    METRICS.observe_many("capture_lag_seconds", [now_ts - flow.last_ts for flow in flows], LAG_BUCKETS)
+    METRICS.inc("flows_estimated_total", sum(flow.weight for flow in flows))
+    partial = sum(flow.evicted for flow in flows)
+    if partial:
+        METRICS.inc("flows_partial_total", partial)
+    return rows
+
+def read_ssh_packets(pcap_path, ports):
+    """All watched packets of one file as a list, plus (read seconds, parse
+    seconds, file bytes) so both stages are timed apart, also in pool workers."""
+    t0 = time.perf_counter()
+    data = read_capture(pcap_path)
+    t1 = time.perf_counter()
+    try:
+        pkts = list(iter_ssh_packets_data(data, ports))
+    except UnsupportedPcap:
+        pkts = list(iter_ssh_packets_scapy(pcap_path, ports))
+    return pkts, (t1 - t0, time.perf_counter() - t1, len(data))
+
+def record_file_read(timing, n_packets):
+    read_s, parse_s, nbytes = timing
+    METRICS.observe("stage_seconds", read_s, stage="read")
+    METRICS.observe("stage_seconds", parse_s, stage="parse")
+    METRICS.inc("bytes_read_total", nbytes)
+    METRICS.inc("packets_total", n_packets)
+    METRICS.observe("file_packets", n_packets, COUNT_BUCKETS)
+
+def feed_pcap_file(table, pcap_path):
+    """Push one rotated pcap through the persistent flow table and return
+    rows for the flows that finished (FIN/RST, idle or active timeout)."""
+    done = []
     try:
-        with PcapReader(pcap_path) as rdr:
-            for pkt in rdr:
-                if IP in pkt and TCP in pkt:
-                    sport = int(pkt[TCP].sport)
-                    dport = int(pkt[TCP].dport)
-                    if sport == 22 or dport == 22:
-                        ts = float(pkt.time)
-                        plen = int(len(pkt))
-                        src = pkt[IP].src
-                        dst = pkt[IP].dst
-                        flags = int(pkt[TCP].flags)
-                        tcp_win = int(getattr(pkt[TCP], "window", 0))
-                        try:
-                            tcp_hdr_len = int(pkt[TCP].dataofs) * 4
-                        except Exception:
-                            tcp_hdr_len = 0
-                        try:
-                            payload_len = len(bytes(pkt[TCP].payload))
-                        except Exception:
-                            ip_hdr_len = int(getattr(pkt[IP], "ihl", 0)) * 4 if hasattr(pkt[IP], "ihl") else 0
-                            payload_len = max(0, plen - ip_hdr_len - tcp_hdr_len)
-                        if dport == 22:
-                            key = (src, dst, dport)
-                            direction = 'fwd'
-                        else:
-                            key = (dst, src, sport)
-                            direction = 'bwd'
-                        flows[key].append((ts, plen, direction, flags, tcp_win, tcp_hdr_len, payload_len))
+        pkts, timing = read_ssh_packets(pcap_path, WATCH_PORTS)
+        record_file_read(timing, len(pkts))
+        with METRICS.stage("aggregate"):
+            for conn, item in pkts:
+                done.extend(table.add(conn, item))
     except Exception as e:
         log(f"[ERROR] Error reading pcap: {pcap_path}: {e}")
+        METRICS.inc("errors_total", stage="read")
+        traceback.print_exc()
+    done.extend(table.expire())
+    try:
+        return rows_from_flows(done)
+    except Exception as e:
+        log(f"[ERROR] computing features for {pcap_path}: {e}")
         traceback.print_exc()
         return []
 
-    rows = []
-    now_ts = time.time()
-    for key, items in flows.items():
-        try:
-            items.sort(key=lambda x: x[0])
-            times = [t for (t,_,_,_,_,_,_) in items]
-            lens  = [l for (_,l,_,_,_,_,_) in items]
-            dirs  = [d for (_,_,d,_,_,_,_) in items]
-            flags = [f for (_,_,_,f,_,_,_) in items]
-            tcp_wins = [w for (_,_,_,_,w,_,_) in items]
-            tcp_hdrs = [h for (_,_,_,_,_,h,_) in items]
-            payloads = [p for (_,_,_,_,_,_,p) in items]
-
-            duration = max(times) - min(times) if len(times) > 1 else 0.0
-            total_bwd = sum(1 for d in dirs if d == 'bwd')
-            total_fwd = sum(1 for d in dirs if d == 'fwd')
-            sum_bytes = sum(lens)
-            sum_fwd_bytes = sum(l for (l,dirc) in zip(lens, dirs) if dirc == 'fwd')
-            sum_bwd_bytes = sum(l for (l,dirc) in zip(lens, dirs) if dirc == 'bwd')
-
-            mean_len = float(np.mean(lens)) if lens else 0.0
-            packet_len_min = int(np.min(lens)) if lens else 0
-            packet_len_max = int(np.max(lens)) if lens else 0
-            pps = float(len(items) / duration) if duration > 0 else float(len(items))
-            bwd_pps = float(total_bwd / duration) if duration > 0 else float(total_bwd)
-
-            fwd_times = [t for (t,_,d,_,_,_,_) in items if d == 'fwd']
-            fwd_iat = float(np.mean(np.diff(sorted(fwd_times)))) if len(fwd_times) > 1 else 0.0
-
-            iat_all = np.diff(sorted(times)) if len(times) > 1 else np.array([0.0])
-            flow_iat_max = float(np.max(iat_all)) if len(iat_all) > 0 else 0.0
-
-            syn_count = sum(1 for f in flags if (int(f) & 0x02) != 0)
-
-            init_win_forward = 0
-            init_win_backward = 0
-            for (t,l,d,f,w,h,p) in items:
-                if d == 'fwd' and init_win_forward == 0:
-                    init_win_forward = w
-                if d == 'bwd' and init_win_backward == 0:
-                    init_win_backward = w
-                if init_win_forward and init_win_backward:
-                    break
+_csv_checked = set()
 
-            fwd_payloads = [p for (t,l,d,fl,w,h,p) in items if d == 'fwd']
-            bwd_payloads = [p for (t,l,d,fl,w,h,p) in items if d == 'bwd']
-            min_seg_size_forward = int(np.min(fwd_payloads)) if fwd_payloads else 0
-
-            bwd_header_len = float(np.mean([h for (t,l,d,fl,w,h,p) in items if d=='bwd'])) if any(d=='bwd' for d in dirs) else 0.0
-            fwd_header_len_1 = float(np.mean([h for (t,l,d,fl,w,h,p) in items if d=='fwd'])) if any(d=='fwd' for d in dirs) else 0.0
-
-            fwd_lens = [l for (t,l,d,fl,w,h,p) in items if d == 'fwd']
-            bwd_lens = [l for (t,l,d,fl,w,h,p) in items if d == 'bwd']
-            fwd_pkt_len_min = int(np.min(fwd_lens)) if fwd_lens else 0
-            bwd_pkt_len_min = int(np.min(bwd_lens)) if bwd_lens else 0
-            bwd_pkt_len_mean = float(np.mean(bwd_lens)) if bwd_lens else 0.0
-
-            average_pkt_size = mean_len
-            subflow_fwd_bytes = int(sum_fwd_bytes)
-            subflow_bwd_packets = int(total_bwd)
-            down_up_ratio = float(sum_bwd_bytes / sum_fwd_bytes) if sum_fwd_bytes > 0 else 0.0
-
-            client, server, srvport = key
-
-            row = {
-                "destination port": int(srvport),
-                "flow bytes/s": float(sum_bytes / duration) if duration > 0 else float(sum_bytes),
-                "min packet length": int(packet_len_min),
-                "bwd packets/s": float(bwd_pps),
-                "bwd packet length min": int(bwd_pkt_len_min),
-                "min_seg_size_forward": int(min_seg_size_forward),
-                "bwd header length": float(bwd_header_len),
-                "average packet size": float(average_pkt_size),
-                "max packet length": int(packet_len_max),
-                "subflow fwd bytes": int(subflow_fwd_bytes),
-                "bwd packet length mean": float(bwd_pkt_len_mean),
-                "packet length mean": float(mean_len),
-                "subflow bwd packets": int(subflow_bwd_packets),
-                "fwd header length.1": float(fwd_header_len_1),
-                "total backward packets": int(total_bwd),
-                "flow iat max": float(flow_iat_max),
-                "down/up ratio": float(down_up_ratio),
-                "src_ip": client,
-                "dst_ip": server,   
-                "timestamp": now_ts
-            }
-            rows.append(row)
-        except Exception as e:
-            log(f"[ERROR] processing flow {key} in {pcap_path}: {e}")
-            traceback.print_exc()
-            continue
-
-    return rows
-
-def append_rows_to_csv(rows, out_csv=OUT_CSV):
+def append_rows_to_csv(rows, out_csv):
     if not rows:
         return
     df = pd.DataFrame(rows)
@@ -206,6 +352,16 @@ def append_rows_to_csv(rows, out_csv=OUT_CSV):
     cols = [c for c in FEATURE_ORDER if c in df.columns]
     df = df[cols]
     header = not os.path.exists(out_csv)
+    if not header and out_csv not in _csv_checked:
+        # a different model/plan changes the columns: never append under an old header
+        with open(out_csv) as f:
+            old = f.readline().rstrip("\r\n").split(",")
+        if old != cols:
+            moved = f"{out_csv}.{time.strftime('%Y%m%d%H%M%S')}.old"
+            os.replace(out_csv, moved)
+            log(f"[worker] CSV columns changed, moved old file to {moved}")
+            header = True
+    _csv_checked.add(out_csv)
     try:
         df.to_csv(out_csv, mode='a', header=header, index=False)
         log(f"[worker] appended {len(df)} rows to {out_csv}")
@@ -218,65 +374,701 @@ def append_rows_to_csv(rows, out_csv=OUT_CSV):
         except Exception as e2:
             log(f"[ERROR] fallback temp write also failed: {e2}")
 
-def load_processed_set():
-    if not os.path.exists(PROCESSED_LIST):
-        return set()
+_ring = None
+_publisher = None
+_segments = None
+
+def get_ring():
+    global _ring
+    if _ring is None:
+        _ring = FeatureRingWriter(FEATURE_RING, PLAN.names, RING_CAPACITY)
+    return _ring
+
+def get_publisher():
+    global _publisher
+    if _publisher is None:
+        _publisher = FeaturePublisher(FEATURE_SOCKET, PLAN.names)
+    return _publisher
+
+def get_segments():
+    global _segments
+    if _segments is None:
+        _segments = SegmentWriter(FEATURE_DIR, SEGMENT_SECONDS, SEGMENT_RETAIN, SEGMENT_ARCHIVE,
+                                  ARCHIVE_CODEC, ARCHIVE_LEVEL, on_error=segment_failed, on_retire=segment_retired)
+        atexit.register(_segments.close)   # rows written by the shutdown flush
+    return _segments
+
+def segment_failed(name, e):
+    log(f"[WARN] cannot retire feature segment {name}: {e}", key="segment-retire")
+    METRICS.inc("errors_total", stage="segments")
+
+def segment_retired(name, dst):
+    METRICS.inc("segments_retired_total")
+    log(f"[debug] feature segment {name} {'archived to ' + dst if dst else 'deleted'}")
+
+def write_segment(rows):
+    df = pd.DataFrame(rows)
+    cols = [c for c in FEATURE_ORDER if c in df.columns]
     try:
-        with open(PROCESSED_LIST, "r") as f:
-            return set(line.strip() for line in f if line.strip())
+        path = get_segments().write(df[cols])
+        log(f"[worker] appended {len(df)} rows to {path}")
     except Exception as e:
-        log(f"[WARN] cannot read processed list: {e}")
-        return set()
+        log(f"[ERROR] feature segment write failed: {e}")
+        METRICS.inc("errors_total", stage="output")
 
-def add_to_processed(fname):
+def expire_segments():
+    """Segment retention on the loop tick, also when no rows are written."""
+    if not WRITE_CSV:
+        return
     try:
-        with open(PROCESSED_LIST, "a") as f:
-            f.write(fname + "\n")
+        get_segments().tick()
     except Exception as e:
-        log(f"[WARN] failed to add to processed list {fname}: {e}")
+        log(f"[ERROR] feature segment retention failed: {e}", key="segment-tick")
+        METRICS.inc("errors_total", stage="segments")
 
-def watch_and_process():
-    seen = load_processed_set()
-    log(f"[INFO] watching {PCAP_DIR} (seen {len(seen)} entries)")
-    while True:
+def publish_rows(rows):
+    """Hand finished feature rows to the detector: binary ring (durable),
+    push over the Unix socket (fast path), plus the CSV segments."""
+    global _published
+    if not rows:
+        return
+    with METRICS.stage("output"):
+        seq, records = None, None
         try:
-            files = sorted([os.path.join(PCAP_DIR, f) for f in os.listdir(PCAP_DIR) if f.endswith(".pcap")])
-            log(f"[debug] found {len(files)} .pcap files")
-            for f in files:
+            seq, records = get_ring().append(rows)
+        except Exception as e:
+            log(f"[ERROR] feature ring append failed: {e}")
+            METRICS.inc("errors_total", stage="output")
+        if FEATURE_SOCKET:
+            pub = get_publisher()
+            if records is None:
+                records = rows_to_records(rows, PLAN.names)
+            was_connected = pub.connected
+            pub.publish(records, seq)
+            if pub.connected != was_connected:
+                log(f"[worker] detector push channel {'up' if pub.connected else 'down'}")
+            METRICS.set("detector_connected", int(pub.connected))
+        if WRITE_CSV:
+            write_segment(rows)
+    METRICS.inc("rows_total", len(rows))
+    _published = True
+
+def new_flow_table(**kw):
+    return FlowTable(track=PLAN.track, max_flows=MAX_FLOWS, sample_every=SAMPLE_EVERY, **kw)
+
+_status_sent = (False, 0.0)
+
+def record_table(table, input_time=None):
+    """Flow table gauges/counters, the event-time watermark (see
+    FlowTable.watermark; `input_time` = how far the input is known to be
+    complete) and the degraded state for the detector: sent when overload
+    starts or ends, repeated every STATUS_INTERVAL."""
+    global _status_sent
+    METRICS.set("flows_open", len(table))
+    if table.clock or input_time is not None:
+        try:
+            ring = get_ring()
+            ring.set_watermark(table.watermark(input_time))
+            METRICS.set("watermark_lag_seconds", time.time() - ring.watermark)
+        except Exception as e:
+            log(f"[ERROR] cannot update watermark: {e}", key="watermark")
+    METRICS.set("overloaded", int(table.overloaded))
+    if table.shed_packets:
+        METRICS.inc("packets_shed_total", table.shed_packets)
+        table.shed_packets = 0
+    was, sent_at = _status_sent
+    now = time.time()
+    if table.overloaded == was and (not was or now - sent_at < STATUS_INTERVAL):
+        return
+    sampling = table.sample_every if table.overloaded and table.sample_every > 1 else 1
+    if table.overloaded != was:
+        if table.overloaded:
+            log(f"[WARN] overload: {len(table)} flows open, evicting least recently active"
+                + (f", tracking 1 in {sampling} new connections" if sampling > 1 else ""))
+        else:
+            log(f"[INFO] overload over, {len(table)} flows open ({table.evicted} flows cut early)")
+    _status_sent = (table.overloaded, now)
+    if FEATURE_SOCKET:
+        get_publisher().send_status({"degraded": table.overloaded, "sample_every": sampling,
+                                     "flows_open": len(table), "max_flows": table.max_flows,
+                                     "evicted": table.evicted, "time": now})
+
+_state = None        # (mode, {name: FlowTable}, inputs(), checkpoint) of the running mode
+_state_saved = 0.0
+_published = False   # rows published since the last snapshot
+_snapshot_seq = None  # checkpoint commit count the last snapshot was taken at
+
+def track_state(mode, tables, inputs=dict, checkpoint=None):
+    global _state, _snapshot_seq
+    _state = (mode, tables, inputs, checkpoint)
+    _snapshot_seq = None
+
+def save_state(final=False):
+    """End of a loop turn: write the processed checkpoint if files were
+    committed, then snapshot the flow tables registered with track_state():
+    always when `final` (shutdown) or when the checkpoint moved since the
+    last snapshot (restore_state drops a snapshot from another commit),
+    after rows were published unless the live table is overloaded,
+    otherwise at most every SNAPSHOT_INTERVAL.
+    Returns True if a snapshot was written."""
+    global _state_saved, _published, _snapshot_seq
+    if _state is None:
+        return False
+    mode, tables, inputs, checkpoint = _state
+    if checkpoint is not None:
+        try:
+            checkpoint.sync()
+        except Exception as e:
+            log(f"[WARN] failed to write checkpoint {CHECKPOINT}: {e}", key="checkpoint")
+            return False   # a snapshot must not get ahead of the checkpoint
+    if not STATE_SNAPSHOT:
+        return False
+    committed = checkpoint is not None and checkpoint.seq != _snapshot_seq
+    if not final and not committed and time.time() - _state_saved < SNAPSHOT_INTERVAL and (
+            not _published or tables["live"].overloaded):
+        return False
+    t0 = time.perf_counter()
+    try:
+        n = save_snapshot(STATE_SNAPSHOT, tables, dict(inputs(), mode=mode))
+    except Exception as e:
+        log(f"[WARN] cannot write state snapshot {STATE_SNAPSHOT}: {e}", key="snapshot", every=LOG_RATE_INTERVAL)
+        return False
+    _state_saved = time.time()
+    _published = False
+    if checkpoint is not None:
+        _snapshot_seq = checkpoint.seq
+    METRICS.observe("stage_seconds", time.perf_counter() - t0, stage="snapshot")
+    METRICS.set("snapshot_bytes", n)
+    return True
+
+def restore_state(mode, tables, seen=None):
+    """Load STATE_SNAPSHOT into the empty `tables` if it was written in the
+    same mode and, with a processed checkpoint, at its current commit.
+    Returns the snapshot's inputs, or None when starting fresh."""
+    if not STATE_SNAPSHOT or not os.path.exists(STATE_SNAPSHOT):
+        return None
+    try:
+        inputs, created, states = load_snapshot(STATE_SNAPSHOT)
+        if inputs.get("mode") != mode:
+            raise SnapshotError(f"written in {inputs.get('mode')} mode")
+        if seen is not None and inputs.get("seq") != seen.seq:
+            raise SnapshotError(f"taken at commit {inputs.get('seq')}, checkpoint is at {seen.seq}")
+        n = sum(restore_table(tables[name], st) for name, st in states.items() if name in tables)
+    except Exception as e:
+        for t in tables.values():
+            t.flush()
+        log(f"[WARN] state snapshot not used ({e}), starting with empty flow tables")
+        return None
+    log(f"[INFO] restored {n} open flows from {STATE_SNAPSHOT} ({time.time() - created:.0f} s old)")
+    return inputs
+
+def load_processed_set():
+    try:
+        return ProcessedCheckpoint(CHECKPOINT, legacy_list=PROCESSED_LIST)
+    except Exception as e:
+        log(f"[WARN] cannot read checkpoint {CHECKPOINT}: {e}, starting empty")
+        try:
+            os.replace(CHECKPOINT, CHECKPOINT + ".bad")
+        except OSError:
+            pass
+        return ProcessedCheckpoint(CHECKPOINT)
+
+def add_to_processed(seen, fname):
+    try:
+        seen.add(fname)
+    except Exception as e:
+        log(f"[WARN] failed to checkpoint {fname}: {e}")
+
+def list_pcap_files(seen=None):
+    names = [f for f in os.listdir(PCAP_DIR) if f.endswith(".pcap")]
+    if seen is not None:
+        seen.prune(names)
+    return [os.path.join(PCAP_DIR, f) for f in sorted(names, key=lambda n: (rotation_stamp(n), n))]
+
+def mark_processed(f, seen):
+    add_to_processed(seen, f)
+
+def check_ready(f, seen, closed=False):
+    """'skip', 'defer' (still being written) or 'ready'. `closed` means
+    inotify already told us tcpdump closed it, so no stale-mtime wait."""
+    if f in seen:
+        if _archive is not None:
+            _archive.submit(f)   # processed before a restart, not archived yet
+        return "skip"
+    try:
+        size = os.path.getsize(f)
+        age = time.time() - os.path.getmtime(f)
+    except FileNotFoundError:
+        return "skip"   # rotated away by tcpdump -W before we got to it
+    if size < MIN_FILE_SIZE:
+        log(f"[debug] skipping small file {f} size={size}")
+        mark_processed(f, seen)
+        return "skip"
+    if not closed and age < STALE_SECONDS:
+        log(f"[debug] skipping {f} because recently modified ({age:.2f}s)", key="fresh", every=10)
+        return "defer"
+    return "ready"
+
+def commit_file(f, rows, table, seen, lane="live"):
+    log(f"[debug] extracted {len(rows)} rows from {f} ({len(table)} flows open, {lane})")
+    if rows:
+        publish_rows(rows)
+    mark_processed(f, seen)
+    if _archive is not None:
+        _archive.submit(f)
+    METRICS.inc("files_total", lane=lane)
+    METRICS.observe("file_flows", len(rows), COUNT_BUCKETS)
+    if lane == "live":
+        record_table(table)   # watermark and overload state follow the live table
+    try:
+        METRICS.observe("file_lag_seconds", time.time() - os.path.getmtime(f), LAG_BUCKETS, lane=lane)
+    except OSError:
+        pass
+
+def handle_pcap_file(f, table, seen, closed=False):
+    """Process one rotated file in this process.
+    Returns True if the file was too fresh and should be retried."""
+    try:
+        state = check_ready(f, seen, closed)
+        if state != "ready":
+            return state == "defer"
+        if not closed:
+            time.sleep(SLEEP_AFTER_DETECT)
+        log(f"[debug] processing file {f}")
+        commit_file(f, feed_pcap_file(table, f), table, seen)
+    except Exception as e:
+        log(f"[ERROR] inner loop error for {f}: {e}")
+        traceback.print_exc()
+    return False
+
+def segment_pcap_file(pcap_path, ports, track, max_flows=0, sample_every=0):
+    """Pool task: parse one file and pre-aggregate it into per-connection
+    flow segments (finished ones, then the ones still open at EOF). The
+    local table has the same cap and sampling as the main one."""
+    local = FlowTable(track=track, max_flows=max_flows, sample_every=sample_every)
+    finished = []
+    pkts, timing = read_ssh_packets(pcap_path, ports)
+    t0 = time.perf_counter()
+    for conn, item in pkts:
+        finished.extend(local.add(conn, item))
+    return (finished, local.flush(), timing, len(pkts), time.perf_counter() - t0,
+            local.shed_packets)
+
+def file_age(f):
+    try:
+        return time.time() - os.path.getmtime(f)
+    except OSError:
+        return 0.0
+
+class BacklogLane:
+    """Files older than the live edge after a restart or a real stall
+    (startup backlog, inotify overflow). They get their own flow table,
+    since their packets are older than the live table's; when the lane is
+    drained its open flows go back into the live table, merged with the
+    part of the same connection seen there meanwhile.
+    Files commit strictly oldest-first, a slice per step() between live
+    work: with a pool the niced workers pre-aggregate files and step()
+    merges only results that are already done; without one step() runs
+    files in this process until BACKLOG_SLICE is used."""
+
+    def __init__(self, pool, live_table):
+        self.pool = pool
+        self.live = live_table
+        self.table = new_flow_table()
+        self.todo = deque()
+        self.inflight = deque()
+        self.queued = set()
+        self.edge = None       # rotation stamp of the oldest live-edge file
+
+    def __len__(self):
+        return len(self.todo) + len(self.inflight)
+
+    def route(self, ready):
+        """Take the files of a sorted ready batch that are older than the
+        live edge; returns the rest (the live ones). Only a batch with more
+        than LIVE_EDGE_FILES files whose oldest one is more than BACKLOG_LAG
+        behind moves the edge up to its newest ones; if the lane is idle
+        then, it takes over the live table's open flows, since those
+        continue in the files now queued here (restart after an outage)."""
+        if len(ready) > LIVE_EDGE_FILES and file_age(ready[0]) > BACKLOG_LAG:
+            edge = rotation_stamp(ready[-LIVE_EDGE_FILES])
+            if self.edge is None or edge > self.edge:
+                self.edge = edge
+                if not len(self) and not len(self.table) and len(self.live):
+                    self._take_flows()
+        elif self.edge is None and ready:
+            self.edge = rotation_stamp(ready[0])
+        live, n = [], 0
+        for f in ready:
+            if f in self.queued:
+                continue
+            if rotation_stamp(f) < self.edge:
+                self.todo.append(f)
+                self.queued.add(f)
+                n += 1
+            else:
+                live.append(f)
+        if n:
+            log(f"[INFO] {n} backlog files queued behind the live edge ({len(self)} in backlog lane)")
+        METRICS.set("backlog_files", len(self))
+        return live
+
+    def _take_flows(self):
+        mine, live = self.table, self.live
+        mine.flows, live.flows = live.flows, mine.flows
+        mine.closing, live.closing = live.closing, mine.closing
+        mine.clock = live.clock
+
+    def step(self, seen):
+        if not self.todo and not self.inflight:
+            if len(self.table):   # restored from a snapshot, nothing left to read
+                self.hand_back()
+            return
+        if self.pool is not None:
+            while self.todo and len(self.inflight) < MAX_INFLIGHT and not _stop:
+                f = self.todo.popleft()
+                self.inflight.append((f, self.pool.submit(segment_pcap_file, f, WATCH_PORTS, PLAN.track,
+                                                          MAX_FLOWS, SAMPLE_EVERY)))
+            while self.inflight and self.inflight[0][1].done() and not _stop:
+                f, fut = self.inflight.popleft()
+                self._merge(f, fut, seen)
+        else:
+            deadline = time.time() + BACKLOG_SLICE
+            while self.todo and time.time() < deadline and not _stop:
+                f = self.todo.popleft()
                 try:
-                    if f in seen:
-                        continue
-                    size = os.path.getsize(f)
-                    mtime = os.path.getmtime(f)
-                    if size < MIN_FILE_SIZE:
-                        log(f"[debug] skipping small file {f} size={size}")
-                        add_to_processed(f)
-                        seen.add(f)
-                        continue
-                    age = time.time() - mtime
-                    if age < STALE_SECONDS:
-                        log(f"[debug] skipping {f} because recently modified ({age:.2f}s)")
-                        continue
-                    time.sleep(SLEEP_AFTER_DETECT)
-                    log(f"[debug] processing file {f} (size={size} age={age:.1f}s)")
-                    rows = process_pcap_file(f)
-                    log(f"[debug] extracted {len(rows)} rows from {f}")
-                    if rows:
-                        append_rows_to_csv(rows)
-                    add_to_processed(f)
-                    seen.add(f)
+                    commit_file(f, feed_pcap_file(self.table, f), self.table, seen, lane="backlog")
                 except Exception as e:
                     log(f"[ERROR] inner loop error for {f}: {e}")
                     traceback.print_exc()
-                    continue
-            time.sleep(1)
-        except KeyboardInterrupt:
-            log("[worker] stopped by user")
-            break
+                self.queued.discard(f)
+        METRICS.set("backlog_files", len(self))
+        if not self.todo and not self.inflight:
+            # caught up: flows still open here continue in the live table
+            self.hand_back()
+            log("[INFO] backlog lane drained")
+
+    def _merge(self, f, fut, seen):
+        table = self.table
+        try:
+            finished, still_open, timing, n_packets, agg_s, shed = fut.result()
+            record_file_read(timing, n_packets)
+            table.shed_packets += shed
+        except Exception as e:
+            log(f"[ERROR] Error reading pcap: {f}: {e}")
+            METRICS.inc("errors_total", stage="read")
+            finished, still_open, agg_s = [], [], 0.0
+        try:
+            done = []
+            t0 = time.perf_counter()
+            for seg in finished:
+                done.extend(table.merge(seg, True))
+            for seg in still_open:
+                done.extend(table.merge(seg, False))
+            done.extend(table.expire())
+            METRICS.observe("stage_seconds", agg_s + time.perf_counter() - t0, stage="aggregate")
+            commit_file(f, rows_from_flows(done), table, seen, lane="backlog")
+        except Exception as e:
+            log(f"[ERROR] inner loop error for {f}: {e}")
+            traceback.print_exc()
+        self.queued.discard(f)
+
+    def hand_back(self):
+        rows = rows_from_flows(self.live.adopt(self.table.flush()))
+        if rows:
+            publish_rows(rows)
+
+    def flush(self):
+        rows = rows_from_flows(self.table.flush())
+        if rows:
+            publish_rows(rows)
+
+def handle_pcap_files(files, table, seen, closed=False, backlog=None):
+    """Process a sorted batch in this process. With a BacklogLane, files
+    older than the live edge are queued there instead. Returns the set of
+    files that should be retried later."""
+    ready, deferred = [], set()
+    for f in files:
+        state = check_ready(f, seen, closed)
+        if state == "ready":
+            ready.append(f)
+        elif state == "defer":
+            deferred.add(f)
+    if backlog is not None:
+        ready = backlog.route(ready)
+    METRICS.set("files_backlog", len(ready))
+    for f in ready:
+        if _stop:
+            break   # the rest is read after the restart
+        if handle_pcap_file(f, table, seen, closed):
+            deferred.add(f)
+    return deferred
+
+def expire_idle_flows(table):
+    # flows whose last packet is older than idle timeout + rotation lag
+    rows = rows_from_flows(table.expire(time.time() - CAPTURE_LAG))
+    if rows:
+        publish_rows(rows)
+    # without new files, capture is complete up to the wall-clock expiry point
+    record_table(table, time.time() - CAPTURE_LAG)
+
+def open_watcher(mask=IN_CLOSE_WRITE | IN_MOVED_TO):
+    if not USE_INOTIFY:
+        return None
+    try:
+        return InotifyWatcher(PCAP_DIR, mask)
+    except InotifyUnavailable as e:
+        log(f"[WARN] inotify unavailable ({e}), falling back to polling")
+        return None
+
+def watch_and_process():
+    seen = load_processed_set()
+    table = new_flow_table()
+    watcher = open_watcher()
+    pool = None
+    if PARALLEL_WORKERS > 1:
+        pool = ProcessPoolExecutor(PARALLEL_WORKERS, initializer=init_pool_worker, initargs=(BACKLOG_NICE,))
+    backlog = BacklogLane(pool, table)
+    track_state("watch", {"live": table, "backlog": backlog.table},
+                lambda: {"seq": seen.seq, "edge": backlog.edge}, seen)
+    inputs = restore_state("watch", {"live": table, "backlog": backlog.table}, seen)
+    if inputs:
+        backlog.edge = inputs.get("edge")
+    mode = "inotify" if watcher else "polling"
+    log(f"[INFO] watching {PCAP_DIR} ({mode}, {PARALLEL_WORKERS} workers, "
+        f"checkpoint at {seen.hwm['name'] or '-'}, {len(seen)} more done)")
+    rescan = True
+    last_scan = 0.0
+    pending = set()   # found by a rescan but still fresh; re-stat until ready
+    while not _stop:
+        try:
+            if watcher is None:
+                files = list_pcap_files(seen)
+                log(f"[debug] found {len(files)} .pcap files", key="scan")
+                handle_pcap_files(files, table, seen, backlog=backlog)
+                expire_idle_flows(table)
+                backlog.step(seen)
+                save_state()
+                expire_segments()
+                time.sleep(BACKLOG_WAIT if len(backlog) else POLL_INTERVAL)
+                continue
+
+            if rescan or time.time() - last_scan >= RESCAN_INTERVAL:
+                # startup backlog, queue overflow, or periodic safety net
+                pending = handle_pcap_files(list_pcap_files(seen), table, seen, backlog=backlog)
+                rescan = False
+                last_scan = time.time()
+            # live files first every turn, then one slice of backlog
+            names, overflow = watcher.wait(BACKLOG_WAIT if len(backlog) else POLL_INTERVAL)
+            closed = [os.path.join(PCAP_DIR, n) for n in sorted(names) if n.endswith(".pcap")]
+            pending.difference_update(closed)
+            handle_pcap_files(closed, table, seen, closed=True, backlog=backlog)
+            if pending:
+                pending = handle_pcap_files(sorted(pending), table, seen, backlog=backlog)
+            if overflow:
+                log("[WARN] inotify queue overflow, rescanning directory")
+                rescan = True
+            expire_idle_flows(table)
+            backlog.step(seen)
+            save_state()
+            expire_segments()
         except Exception as e:
             log(f"[worker] loop error: {e}")
             traceback.print_exc()
             time.sleep(2)
+    log("[worker] stopping")
+    if not save_state(final=True):   # else open flows continue after the restart
+        backlog.flush()
+        publish_rows(rows_from_flows(table.flush()))
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+    stop_archive()
+
+def live_capture(src):
+    """Feed packets from a pcap stream straight into the flow table and
+    write rows as soon as flows finish. `src` is '-' for stdin or a FIFO
+    path; a FIFO is reopened when the writer (tcpdump) goes away."""
+    table = new_flow_table(close_linger=LIVE_CLOSE_LINGER)
+    track_state("live", {"live": table})
+    restore_state("live", {"live": table})
+    log(f"[INFO] live capture from {'stdin' if src == '-' else src}")
+    while not _stop:
+        fd = sys.stdin.buffer.fileno() if src == "-" else os.open(src, os.O_RDONLY)
+        stream = PcapStream(WATCH_PORTS)
+        while not _stop:
+            r, _, _ = select.select([fd], [], [], LIVE_TICK)
+            done = []
+            idle_until = None   # nothing pending on the stream: input complete up to now
+            if r:
+                data = os.read(fd, LIVE_READ_SIZE)
+                if not data:
+                    log(f"[live] end of stream after {stream.consumed} bytes")
+                    break
+                try:
+                    with METRICS.stage("parse"):
+                        pkts = stream.feed(data)
+                    with METRICS.stage("aggregate"):
+                        for conn, item in pkts:
+                            done.extend(table.add(conn, item))
+                    METRICS.inc("bytes_read_total", len(data))
+                    METRICS.inc("packets_total", len(pkts))
+                except UnsupportedPcap as e:
+                    log(f"[ERROR] live stream is not a classic pcap ({e}); use tcpdump -w - without --pcapng")
+                    return
+                done.extend(table.expire())
+            else:
+                idle_until = time.time()
+                done.extend(table.expire(idle_until))
+            if done:
+                publish_rows(rows_from_flows(done))
+            record_table(table, idle_until)
+            save_state()
+            expire_segments()
+        if src == "-":
+            break
+        os.close(fd)
+    if _stop:
+        log("[worker] stopping")
+        if save_state(final=True):
+            return
+    publish_rows(rows_from_flows(table.flush()))
+
+def resume_tail(inputs, seen):
+    """PcapTail continuing the followed file where the snapshot left it."""
+    path, ino, offset = (inputs or {}).get("tail") or (None, 0, 0)
+    if path is None or path in seen:
+        return None
+    try:
+        if os.stat(path).st_ino != ino:
+            return None
+        tail = PcapTail(path, WATCH_PORTS, offset)
+    except (OSError, UnsupportedPcap) as e:
+        log(f"[WARN] cannot resume {path} at byte {offset}: {e}")
+        return None
+    log(f"[follow] resuming {path} at byte {offset}")
+    return tail
+
+def follow_capture():
+    """Tail the newest rotation file as tcpdump appends to it. Older files
+    (backlog) are processed normally first; when tcpdump rotates, the old
+    file is drained, checkpointed, and the new one is followed from 0.
+    Note tcpdump without -U flushes its output in blocks, so under very
+    light traffic packets still show up with some delay."""
+    seen = load_processed_set()
+    table = new_flow_table(close_linger=LIVE_CLOSE_LINGER)
+    watcher = open_watcher(IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO)
+    log(f"[INFO] following newest file in {PCAP_DIR} ({'inotify' if watcher else 'polling'})")
+    track_state("follow", {"live": table},
+                lambda: {"seq": seen.seq, "tail": [tail.path, tail.ino, tail.offset] if tail else None}, seen)
+    tail = resume_tail(restore_state("follow", {"live": table}, seen), seen)
+    rescan = True
+    while not _stop:
+        if rescan:
+            files = list_pcap_files(seen)
+            newest = files[-1] if files else None
+            backlog = [f for f in files if f != newest and (tail is None or f != tail.path)]
+            handle_pcap_files(backlog, table, seen)
+            if newest is not None and (tail is None or newest != tail.path):
+                if tail is not None:
+                    drain_tail(tail, table, seen)
+                tail = PcapTail(newest, WATCH_PORTS) if newest not in seen else None
+                if tail is not None:
+                    log(f"[follow] tailing {newest}")
+            rescan = False
+        done = []
+        if tail is not None:
+            try:
+                with METRICS.stage("parse"):
+                    pkts = tail.read_new()
+                with METRICS.stage("aggregate"):
+                    for conn, item in pkts:
+                        done.extend(table.add(conn, item))
+                METRICS.inc("packets_total", len(pkts))
+            except FileNotFoundError:
+                tail = None
+                rescan = True
+        done.extend(table.expire())
+        done.extend(table.expire(time.time() - CAPTURE_LAG))
+        if done:
+            publish_rows(rows_from_flows(done))
+        record_table(table, time.time() - CAPTURE_LAG)
+        save_state()
+        expire_segments()
+        if watcher is None:
+            time.sleep(FOLLOW_TICK)
+            rescan = True
+            continue
+        names, overflow = watcher.wait(FOLLOW_TICK)
+        current = os.path.basename(tail.path) if tail is not None else None
+        if overflow or any(n.endswith(".pcap") and n != current for n in names):
+            rescan = True
+    log("[worker] stopping")
+    if not save_state(final=True):
+        if tail is not None:
+            drain_tail(tail, table, seen)
+            seen.sync()
+        publish_rows(rows_from_flows(table.flush()))
+    stop_archive()
+
+def drain_tail(tail, table, seen):
+    """Read what is left of a rotated-away file and checkpoint it."""
+    done = []
+    try:
+        for conn, item in tail.read_new():
+            done.extend(table.add(conn, item))
+    except FileNotFoundError:
+        pass
+    tail.close()
+    done.extend(table.expire())
+    commit_file(tail.path, rows_from_flows(done), table, seen)
+
+def extract_captures(paths, out_csv):
+    """Offline re-extraction (--extract): every capture under `paths`,
+    plain or compressed, through one flow table in rotation order, rows
+    appended to out_csv. Nothing is published or checkpointed."""
+    files = []
+    for p in paths:
+        files.extend(list_captures(p) if os.path.isdir(p) else [p])
+    table = new_flow_table()
+    rows, n = [], 0
+    for i, f in enumerate(files, 1):
+        rows.extend(feed_pcap_file(table, f))
+        if i == len(files):
+            rows.extend(rows_from_flows(table.flush()))
+        if i % 100 == 0 or i == len(files):
+            append_rows_to_csv(rows, out_csv)
+            n += len(rows)
+            rows = []
+            log(f"[extract] {i}/{len(files)} files, {n} rows")
+    log(f"[extract] done -> {out_csv}")
 
 if __name__ == "__main__":
-    watch_and_process()
+    ap = argparse.ArgumentParser(description="pcap -> feature CSV worker")
+    ap.add_argument("--live", nargs="?", const="-", metavar="FIFO",
+                    help="read a pcap stream (tcpdump -U -w -) from stdin or FIFO instead of watching PCAP_DIR")
+    ap.add_argument("--follow", action="store_true",
+                    help="tail the rotation file tcpdump is still writing instead of waiting for it to close")
+    ap.add_argument("--extract", nargs="+", metavar="PATH",
+                    help="re-extract pcap/.pcap.gz/.pcap.zst files or archive directories to --out and exit")
+    ap.add_argument("--out", metavar="CSV", help="output CSV for --extract")
+    ap.add_argument("--ports", metavar="P[,P...]",
+                    help=f"TCP server ports to track (default {','.join(map(str, WATCH_PORTS))})")
+    args = ap.parse_args()
+    if args.ports:
+        WATCH_PORTS = tuple(int(p) for p in args.ports.split(",") if p.strip())
+    init_plan()
+    if args.extract:
+        if not args.out:
+            ap.error("--extract needs --out")
+        extract_captures(args.extract, args.out)
+        sys.exit(0)
+    stop_on_signals()
+    start_metrics()
+    if not args.live:
+        start_archive()
+    if args.live:
+        live_capture(args.live)
+    elif args.follow:
+        follow_capture()
+    else:
+        watch_and_process()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# async_log.py  -- background-thread logger shared by PCAPWorker and MLDetector
+#
+# log() only appends (time, level, message) to a bounded in-memory queue; a
+# writer thread formats the lines and writes them in batches to a file kept
+# open between batches, rotating it by size. Nothing on the caller's path
+# does a syscall. Messages can carry a rate-limit key so that per-second
+# or per-IP lines are written at most once per interval, with a count of
+# the ones that were suppressed. Keys whose interval is over are forgotten
+# every PRUNE_EVERY keyed calls, so per-file or per-IP keys don't pile up.
+import os
+import sys
+import time
+import atexit
+import datetime
+import threading
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+PRUNE_EVERY = 1024       # keyed log() calls between sweeps of the rate-limit state
+
+_LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# the existing messages carry their level as a tag: "[debug] ...", "[WARN] ..."
+_TAG_LEVELS = {"debug": DEBUG, "warn": WARNING, "warning": WARNING, "error": ERROR}
+
+
+def level_of(msg):
+    """Level from a leading "[tag]" in the message, INFO if there is none."""
+    if msg.startswith("["):
+        end = msg.find("]", 1, 12)
+        if end > 0:
+            return _TAG_LEVELS.get(msg[1:end].lower(), INFO)
+    return INFO
+
+
+def parse_level(name):
+    if isinstance(name, int):
+        return name
+    for lvl, n in _LEVEL_NAMES.items():
+        if n.startswith(str(name).upper()):
+            return lvl
+    raise ValueError(f"unknown log level {name!r}")
+
+
+def plain_format(now, msg):
+    return f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))}] {msg}"
+
+
+def epoch_format(now, msg):
+    ts = datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S.%f")
+    return f"[{now:.6f}][{ts}] {msg}"
+
+
+def raw_format(_now, msg):
+    return msg
+
+
+class AsyncLogger:
+    def __init__(self, path, level=INFO, formatter=plain_format, echo=True,
+                 max_bytes=10 * 1024 * 1024, backups=3, queue_size=10000,
+                 flush_interval=0.5, rate_interval=60.0):
+        self.path = path
+        self.level = parse_level(level)
+        self.formatter = formatter
+        self.echo = echo
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.rate_interval = rate_interval
+        self.dropped = 0
+        self._q = deque()
+        self._wake = threading.Event()
+        self._stop = False
+        self._last = {}         # rate key -> (time of the last line written, interval)
+        self._suppressed = {}   # rate key -> lines skipped since then
+        self._keyed = 0         # keyed calls since the last sweep
+        self._f = None
+        self._size = 0
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="async-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, msg, level=None, key=None, every=None):
+        """Queue one message. With `key`, at most one message per `every`
+        seconds (default rate_interval) is kept for that key."""
+        if level is None:
+            level = level_of(msg)
+        if level < self.level:
+            return
+        now = time.time()
+        if key is not None:
+            every = self.rate_interval if every is None else every
+            self._keyed += 1
+            if self._keyed >= PRUNE_EVERY:
+                self._prune(now)
+            last = self._last.get(key)
+            if last is not None and now - last[0] < every:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = (now, every)
+            n = self._suppressed.pop(key, 0)
+            if n:
+                msg = f"{msg} (+{n} similar suppressed)"
+        if os.getpid() != self._pid:
+            # forked pool worker: the writer thread only exists in the parent
+            self._write_now([(now, level, msg)])
+            return
+        if len(self._q) >= self.queue_size:
+            self.dropped += 1
+            return
+        self._q.append((now, level, msg))
+        if level >= ERROR:
+            self._wake.set()
+
+    def _prune(self, now):
+        """Forget rate keys whose interval is over; their next line is
+        written anyway (a pending suppressed count is dropped with them)."""
+        self._keyed = 0
+        for key, (last, every) in list(self._last.items()):
+            if now - last >= every:
+                self._last.pop(key, None)
+                self._suppressed.pop(key, None)
+
+    def debug(self, msg, **kw):
+        self.log(msg, DEBUG, **kw)
+
+    def info(self, msg, **kw):
+        self.log(msg, INFO, **kw)
+
+    def warning(self, msg, **kw):
+        self.log(msg, WARNING, **kw)
+
+    def error(self, msg, **kw):
+        self.log(msg, ERROR, **kw)
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        batch = []
+        q = self._q
+        while q:
+            batch.append(q.popleft())
+        if self.dropped:
+            n, self.dropped = self.dropped, 0
+            batch.append((time.time(), WARNING, f"[WARN] log queue full, {n} messages dropped"))
+        if batch:
+            self._write_now(batch)
+
+    def _write_now(self, batch):
+        text = "".join(self.formatter(now, msg) + "\n" for now, _lvl, msg in batch)
+        if self.echo:
+            try:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            except (OSError, ValueError):
+                pass
+        data = text.encode("utf-8", "replace")
+        try:
+            if self._f is None:
+                self._open()
+            if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._f.write(data)
+            self._f.flush()
+            self._size += len(data)
+        except OSError:
+            self._close_file()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._f = open(self.path, "ab")
+        self._size = self._f.tell()
+
+    def _rotate(self):
+        self._close_file()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _close_file(self):
+        if self._f is not None:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f = None
+
+    def close(self):
+        if self._stop or os.getpid() != self._pid:
+            return
+        self._stop = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._close_file()
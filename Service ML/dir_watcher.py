@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# dir_watcher.py  -- Linux inotify watcher for the rotated pcap directory
+#
+# tcpdump -G closes each rotation file when it opens the next one, so
+# IN_CLOSE_WRITE (or IN_MOVED_TO when files are renamed into place) means the
+# file is complete. Uses libc through ctypes, no extra packages needed.
+import os
+import select
+import struct
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HDR = struct.Struct("iIII")   # wd, mask, cookie, len
+
+
+class InotifyUnavailable(Exception):
+    pass
+
+
+class InotifyWatcher:
+    def __init__(self, path, mask=IN_CLOSE_WRITE | IN_MOVED_TO):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            init1 = libc.inotify_init1
+            add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise InotifyUnavailable(str(e))
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        fd = init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise InotifyUnavailable(os.strerror(ctypes.get_errno()))
+        wd = add_watch(fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise InotifyUnavailable(f"{path}: {os.strerror(err)}")
+        self.fd = fd
+        self.path = path
+
+    def wait(self, timeout):
+        """Block up to `timeout` seconds. Returns (names, overflow): the file
+        names with a watched event (completed files, by default), and True if
+        the kernel queue overflowed (caller should rescan the directory)."""
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if not r:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        names = []
+        overflow = False
+        pos = 0
+        while pos + _EVENT_HDR.size <= len(data):
+            _wd, mask, _cookie, nlen = _EVENT_HDR.unpack_from(data, pos)
+            pos += _EVENT_HDR.size
+            name = data[pos:pos + nlen].rstrip(b"\0").decode(errors="replace")
+            pos += nlen
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif mask & IN_IGNORED:
+                overflow = True   # watch removed (dir deleted/unmounted)
+            elif name:
+                names.append(name)
+        return names, overflow
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
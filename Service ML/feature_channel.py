@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# feature_channel.py  -- push feature records from PCAPWorker to MLDetector over a Unix socket
+#
+# MLDetector listens, PCAPWorker connects. Every message is length-prefixed:
+#   u32 length | u8 type | payload
+#   type 'H' (hello)  : JSON list of feature names, sent once per connection
+#   type 'R' (records): u64 ring sequence of the first record (NO_SEQ if the
+#                       batch is not in the ring) + raw feature_ring records
+#   type 'S' (status) : JSON object with the worker's state (overload mode,
+#                       sampling rate, ...), sent on change and re-sent on
+#                       every new connection
+# The ring file stays the durable log: if the detector is down or a message
+# is lost, it catches up from the ring using the sequence numbers.
+import os
+import json
+import time
+import socket
+import select
+import struct
+import numpy as np
+from feature_ring import record_dtype
+
+NO_SEQ = 0xFFFFFFFFFFFFFFFF
+_LEN = struct.Struct("!I")
+_SEQ = struct.Struct("!Q")
+MAX_MESSAGE = 64 * 1024 * 1024
+
+SEND_TIMEOUT = 0.05       # detik, never let a slow detector stall the worker
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 10.0
+
+
+def _frame(kind, payload):
+    return _LEN.pack(len(payload) + 1) + kind + payload
+
+
+class FeaturePublisher:
+    """Worker side. publish() never raises; while the detector is away it
+    just drops the push (the ring already has the records) and retries the
+    connection with exponential backoff."""
+
+    def __init__(self, path, feature_names):
+        self.path = path
+        self.hello = _frame(b"H", json.dumps(list(feature_names)).encode())
+        self.status_frame = b""
+        self.sock = None
+        self.next_try = 0.0
+        self.backoff = RECONNECT_MIN
+
+    def _connect(self):
+        now = time.time()
+        if now < self.next_try:
+            return False
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(SEND_TIMEOUT)
+        try:
+            s.connect(self.path)
+            s.sendall(self.hello + self.status_frame)
+        except OSError:
+            s.close()
+            self.next_try = now + self.backoff
+            self.backoff = min(self.backoff * 2, RECONNECT_MAX)
+            return False
+        self.sock = s
+        self.backoff = RECONNECT_MIN
+        return True
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def publish(self, records, seq=None):
+        payload = _SEQ.pack(NO_SEQ if seq is None else seq) + records.tobytes()
+        return self._send(_frame(b"R", payload))
+
+    def send_status(self, status):
+        """Send the worker state (a JSON-able dict); it is remembered and
+        repeated after every reconnect, so a restarted detector gets it too."""
+        self.status_frame = _frame(b"S", json.dumps(status).encode())
+        if self.sock is None:
+            return self._connect()   # the hello carries it
+        return self._send(self.status_frame)
+
+    def _send(self, frame):
+        if self.sock is None and not self._connect():
+            return False
+        try:
+            self.sock.sendall(frame)
+            return True
+        except OSError:
+            # a partial frame may have gone out; the stream is unusable now
+            self.close()
+            self.next_try = time.time() + self.backoff
+            return False
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+class _Conn:
+    __slots__ = ("sock", "buf", "dtype", "names", "status")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf = bytearray()
+        self.dtype = None
+        self.names = None
+        self.status = None
+
+
+class FeatureSubscriber:
+    """Detector side: listening socket plus connected workers."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        # worker runs as the directory's group (pros), detector as root
+        try:
+            os.chown(path, -1, os.stat(os.path.dirname(path) or ".").st_gid)
+        except OSError:
+            pass
+        os.chmod(path, 0o660)
+        self.server.listen(4)
+        self.server.setblocking(False)
+        self.conns = {}
+
+    def poll(self, timeout):
+        """Wait up to `timeout` s. Returns a list of (seq, records, names);
+        seq is None for batches that are not in the ring."""
+        socks = [self.server] + [c.sock for c in self.conns.values()]
+        try:
+            r, _, _ = select.select(socks, [], [], max(0.0, timeout))
+        except InterruptedError:
+            return []
+        out = []
+        for s in r:
+            if s is self.server:
+                try:
+                    cs, _ = self.server.accept()
+                    cs.setblocking(False)
+                    self.conns[cs.fileno()] = _Conn(cs)
+                except OSError:
+                    pass
+                continue
+            conn = self.conns.get(s.fileno())
+            if conn is None:
+                continue
+            try:
+                data = s.recv(1 << 20)
+            except BlockingIOError:
+                continue
+            except OSError:
+                data = b""
+            if not data:
+                self._drop(conn)
+                continue
+            conn.buf += data
+            if not self._parse(conn, out):
+                self._drop(conn)
+        return out
+
+    def _parse(self, conn, out):
+        buf = conn.buf
+        pos = 0
+        while len(buf) - pos >= _LEN.size:
+            n = _LEN.unpack_from(buf, pos)[0]
+            if n < 1 or n > MAX_MESSAGE:
+                return False
+            if len(buf) - pos - _LEN.size < n:
+                break
+            start = pos + _LEN.size
+            kind = bytes(buf[start:start + 1])
+            payload = bytes(buf[start + 1:start + n])
+            pos = start + n
+            if kind == b"H":
+                conn.names = json.loads(payload)
+                conn.dtype = record_dtype(conn.names)
+            elif kind == b"S":
+                conn.status = json.loads(payload)
+            elif kind == b"R" and conn.dtype is not None:
+                seq = _SEQ.unpack_from(payload)[0]
+                recs = np.frombuffer(payload, dtype=conn.dtype, offset=_SEQ.size)
+                out.append((None if seq == NO_SEQ else seq, recs, conn.names))
+            else:
+                return False
+        del buf[:pos]
+        return True
+
+    def worker_status(self):
+        """Latest status dict of every connected worker."""
+        return [c.status for c in self.conns.values() if c.status is not None]
+
+    def _drop(self, conn):
+        self.conns.pop(conn.sock.fileno(), None)
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+    def close(self):
+        for conn in list(self.conns.values()):
+            self._drop(conn)
+        self.server.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# feature_registry.py  -- flow features PCAPWorker can extract, and what each needs
+#
+# Every feature declares the flow accumulators it depends on (TRACK_* from
+# flow_table) and how to compute it from a FlowTable record. A FeaturePlan is built
+# from the feature list of the deployed model, so a flow only accumulates,
+# and a row only contains, what that model consumes.
+#
+# The feature list comes from a sidecar schema next to the model
+# (<model>.features.json: {"features": [...]}) or from the model's
+# feature_names_in_. Write the sidecar with:
+#   python feature_registry.py MODEL.pkl [OUT.json]
+import os
+import json
+from flow_table import (TRACK_BYTES, TRACK_LEN_MIN, TRACK_LEN_MAX, TRACK_LEN_VAR,
+                        TRACK_HDR, TRACK_PAY_MIN, TRACK_IAT)
+
+# flow_start / flow_end: first and last packet time (event time);
+# timestamp: when the row was made (processing time)
+BOOKKEEPING = ["src_ip", "dst_ip", "flow_start", "flow_end", "timestamp"]
+
+
+def _rate(x, dur):
+    return float(x / dur) if dur > 0 else float(x)
+
+
+def _div(a, b):
+    return float(a / b) if b else 0.0
+
+
+def _std(n, m2):
+    # sample standard deviation, like CICFlowMeter
+    return float((m2 / (n - 1)) ** 0.5) if n > 1 else 0.0
+
+
+def _len_min(f):
+    if f.fwd_n and f.bwd_n:
+        return min(f.fwd_len_min, f.bwd_len_min)
+    return f.fwd_len_min if f.fwd_n else f.bwd_len_min
+
+
+def _len_max(f):
+    if f.fwd_n and f.bwd_n:
+        return max(f.fwd_len_max, f.bwd_len_max)
+    return f.fwd_len_max if f.fwd_n else f.bwd_len_max
+
+
+class Feature:
+    __slots__ = ("name", "needs", "from_flow")
+
+    def __init__(self, name, needs, from_flow):
+        self.name = name
+        self.needs = needs          # TRACK_* bits the flow must accumulate
+        self.from_flow = from_flow  # Flow -> value
+
+
+def _features(*specs):
+    return {name: Feature(name, needs, ff) for name, needs, ff in specs}
+
+
+# names are the lower-cased CICIDS2017 column names the models were trained on
+FEATURES = _features(
+    ("destination port", 0,
+     lambda f: int(f.key[2])),
+    ("flow duration", 0,
+     lambda f: float((f.last_ts - f.first_ts) * 1e6)),
+    ("total fwd packets", 0,
+     lambda f: int(f.fwd_n)),
+    ("total backward packets", 0,
+     lambda f: int(f.bwd_n)),
+    ("subflow bwd packets", 0,
+     lambda f: int(f.bwd_n)),
+    ("flow packets/s", 0,
+     lambda f: _rate(f.fwd_n + f.bwd_n, f.last_ts - f.first_ts)),
+    ("fwd packets/s", 0,
+     lambda f: _rate(f.fwd_n, f.last_ts - f.first_ts)),
+    ("bwd packets/s", 0,
+     lambda f: _rate(f.bwd_n, f.last_ts - f.first_ts)),
+    ("flow bytes/s", TRACK_BYTES,
+     lambda f: _rate(f.fwd_bytes + f.bwd_bytes, f.last_ts - f.first_ts)),
+    ("total length of fwd packets", TRACK_BYTES,
+     lambda f: int(f.fwd_bytes)),
+    ("total length of bwd packets", TRACK_BYTES,
+     lambda f: int(f.bwd_bytes)),
+    ("subflow fwd bytes", TRACK_BYTES,
+     lambda f: int(f.fwd_bytes)),
+    ("average packet size", TRACK_BYTES,
+     lambda f: _div(f.fwd_bytes + f.bwd_bytes, f.fwd_n + f.bwd_n)),
+    ("packet length mean", TRACK_BYTES,
+     lambda f: _div(f.fwd_bytes + f.bwd_bytes, f.fwd_n + f.bwd_n)),
+    ("fwd packet length mean", TRACK_BYTES,
+     lambda f: _div(f.fwd_bytes, f.fwd_n)),
+    ("bwd packet length mean", TRACK_BYTES,
+     lambda f: _div(f.bwd_bytes, f.bwd_n)),
+    ("down/up ratio", TRACK_BYTES,
+     lambda f: _div(f.bwd_bytes, f.fwd_bytes)),
+    ("min packet length", TRACK_LEN_MIN,
+     lambda f: int(_len_min(f))),
+    ("fwd packet length min", TRACK_LEN_MIN,
+     lambda f: int(f.fwd_len_min)),
+    ("bwd packet length min", TRACK_LEN_MIN,
+     lambda f: int(f.bwd_len_min)),
+    ("max packet length", TRACK_LEN_MAX,
+     lambda f: int(_len_max(f))),
+    ("fwd packet length max", TRACK_LEN_MAX,
+     lambda f: int(f.fwd_len_max)),
+    ("bwd packet length max", TRACK_LEN_MAX,
+     lambda f: int(f.bwd_len_max)),
+    ("fwd packet length std", TRACK_LEN_VAR,
+     lambda f: _std(f.fwd_n, f.fwd_len_m2)),
+    ("bwd packet length std", TRACK_LEN_VAR,
+     lambda f: _std(f.bwd_n, f.bwd_len_m2)),
+    ("min_seg_size_forward", TRACK_PAY_MIN,
+     lambda f: int(f.fwd_pay_min)),
+    ("bwd header length", TRACK_HDR,
+     lambda f: _div(f.bwd_hdr_sum, f.bwd_n)),
+    ("fwd header length.1", TRACK_HDR,
+     lambda f: _div(f.fwd_hdr_sum, f.fwd_n)),
+    ("flow iat max", TRACK_IAT,
+     lambda f: float(f.iat_max)),
+)
+
+
+class FeaturePlan:
+    """The features one model needs, in the model's column order."""
+
+    def __init__(self, names):
+        names = [str(n) for n in names if str(n).strip().lower() not in BOOKKEEPING]
+        unknown = [n for n in names if n.strip().lower() not in FEATURES]
+        if unknown:
+            raise KeyError(f"no extractor for feature(s): {', '.join(unknown)}")
+        self.names = names   # as the model spells them, rows use these keys
+        self.features = [FEATURES[n.strip().lower()] for n in names]
+        self.track = 0
+        for feat in self.features:
+            self.track |= feat.needs
+
+    @property
+    def columns(self):
+        """Output column order: features, then the BOOKKEEPING columns."""
+        return self.names + BOOKKEEPING
+
+    def row(self, flow, now_ts):
+        row = {name: feat.from_flow(flow) for name, feat in zip(self.names, self.features)}
+        row["src_ip"] = flow.key[0]
+        row["dst_ip"] = flow.key[1]
+        row["flow_start"] = flow.first_ts
+        row["flow_end"] = flow.last_ts
+        row["timestamp"] = now_ts
+        return row
+
+
+def schema_path_for(model_path):
+    return os.path.splitext(model_path)[0] + ".features.json"
+
+
+def read_schema(path):
+    with open(path) as f:
+        data = json.load(f)
+    return list(data["features"] if isinstance(data, dict) else data)
+
+
+def feature_names_from_model(model_path):
+    """feature_names_in_ of a fitted sklearn estimator/scaler (needs joblib)."""
+    import joblib
+    obj = joblib.load(model_path)
+    names = getattr(obj, "feature_names_in_", None)
+    if names is None:
+        raise ValueError(f"{model_path} has no feature_names_in_ (fitted without column names)")
+    return [str(n) for n in names]
+
+
+def load_plan(model_path="", schema_path="", default=None):
+    """Plan from, in order: schema_path, the sidecar next to model_path, the
+    model's feature_names_in_, or `default`. Returns (plan, source)."""
+    candidates = []
+    if schema_path:
+        candidates.append(("schema", schema_path))
+    if model_path:
+        candidates.append(("schema", schema_path_for(model_path)))
+        candidates.append(("model", model_path))
+    for kind, path in candidates:
+        if not os.path.exists(path):
+            continue
+        try:
+            names = read_schema(path) if kind == "schema" else feature_names_from_model(path)
+        except ImportError:
+            continue   # no joblib/sklearn in this environment
+        return FeaturePlan(names), path
+    if default is None:
+        raise FileNotFoundError(f"no feature schema or model found ({model_path or schema_path})")
+    return FeaturePlan(default), "default"
+
+
+def write_schema(model_path, out_path=None):
+    names = feature_names_from_model(model_path)
+    FeaturePlan(names)   # fail early on features we can't extract
+    out_path = out_path or schema_path_for(model_path)
+    with open(out_path, "w") as f:
+        json.dump({"model": os.path.basename(model_path), "features": names}, f, indent=1)
+    return out_path, names
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) not in (2, 3):
+        print("usage: feature_registry.py MODEL.pkl [OUT.json]")
+        sys.exit(1)
+    out, names = write_schema(*sys.argv[1:])
+    print(f"wrote {len(names)} features to {out}")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# feature_ring.py  -- fixed-width binary feature log shared by PCAPWorker and MLDetector
+#
+# A memory-mapped ring file: HEADER_SIZE bytes of header, then `capacity`
+# fixed-size records (float32 features, uint32 IPv4 addresses, float64 flow
+# start/end packet times and processing timestamp). The writer bumps
+# `write_seq` after the records are in place;
+# readers keep their own sequence number and get the new records as a NumPy
+# structured array, no text formatting or parsing on either side.
+#
+# header: magic(8s) version(I) record_size(I) capacity(I) n_features(I)
+#         ring_id(Q) write_seq(Q) watermark(d)   + JSON column names up to HEADER_SIZE
+# The watermark is the worker's event-time progress: rows appended later
+# have flow_end >= watermark (within packet reordering).
+import os
+import mmap
+import json
+import struct
+import socket
+import numpy as np
+
+MAGIC = b"FRING1\0\0"
+VERSION = 2
+HEADER_SIZE = 4096
+_HDR = struct.Struct("<8sIIIIQ")
+_SEQ = struct.Struct("<Q")
+_WM = struct.Struct("<d")
+_SEQ_OFF = _HDR.size
+_WM_OFF = _SEQ_OFF + _SEQ.size
+_NAMES_OFF = _WM_OFF + _WM.size
+
+DEFAULT_CAPACITY = 65536
+
+
+def ip_to_u32(ip):
+    try:
+        return struct.unpack("!I", socket.inet_aton(ip))[0]
+    except (OSError, TypeError):
+        return 0
+
+
+def u32_to_ip(v):
+    return socket.inet_ntoa(struct.pack("!I", int(v)))
+
+
+def _close_map(mm):
+    try:
+        mm.close()
+    except BufferError:
+        pass   # a caller still holds a view; the mapping goes away with it
+
+
+def record_dtype(feature_names):
+    fields = [(name, "<f4") for name in feature_names]
+    fields += [("src_ip", "<u4"), ("dst_ip", "<u4"),
+               ("flow_start", "<f8"), ("flow_end", "<f8"), ("timestamp", "<f8")]
+    return np.dtype(fields)
+
+
+def rows_to_records(rows, feature_names, dtype=None):
+    batch = np.zeros(len(rows), dtype=dtype or record_dtype(feature_names))
+    for name in feature_names:
+        batch[name] = [r.get(name, 0.0) for r in rows]
+    batch["src_ip"] = [ip_to_u32(r.get("src_ip")) for r in rows]
+    batch["dst_ip"] = [ip_to_u32(r.get("dst_ip")) for r in rows]
+    for name in ("flow_start", "flow_end", "timestamp"):
+        batch[name] = [r.get(name, 0.0) for r in rows]
+    return batch
+
+
+class FeatureRingWriter:
+    def __init__(self, path, feature_names, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.feature_names = list(feature_names)
+        self.dtype = record_dtype(self.feature_names)
+        self.capacity = capacity
+        self._open()
+
+    def _open(self):
+        size = HEADER_SIZE + self.capacity * self.dtype.itemsize
+        names = json.dumps(self.feature_names).encode()
+        if _NAMES_OFF + len(names) > HEADER_SIZE:
+            raise ValueError("too many feature names for ring header")
+        reuse = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) == size:
+            with open(self.path, "rb") as f:
+                head = f.read(HEADER_SIZE)
+            magic, ver, rsize, cap, nfeat, _rid = _HDR.unpack_from(head)
+            stored = head[_NAMES_OFF:].rstrip(b"\0")
+            reuse = (magic == MAGIC and ver == VERSION and rsize == self.dtype.itemsize
+                     and cap == self.capacity and stored == names)
+        if not reuse:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.truncate(size)
+                f.write(_HDR.pack(MAGIC, VERSION, self.dtype.itemsize, self.capacity,
+                                  len(self.feature_names), int.from_bytes(os.urandom(8), "little")))
+                f.write(_SEQ.pack(0))
+                f.write(_WM.pack(0.0))
+                f.write(names)
+            os.replace(tmp, self.path)
+        self.fd = os.open(self.path, os.O_RDWR)
+        self.mm = mmap.mmap(self.fd, size)
+        self.records = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self.mm, offset=HEADER_SIZE)
+        self.write_seq = _SEQ.unpack_from(self.mm, _SEQ_OFF)[0]
+        self.watermark = _WM.unpack_from(self.mm, _WM_OFF)[0]
+
+    def set_watermark(self, ts):
+        """Advance the event-time watermark (never moves back)."""
+        if ts > self.watermark:
+            self.watermark = ts
+            _WM.pack_into(self.mm, _WM_OFF, ts)
+
+    def append(self, rows):
+        """Append feature row dicts (feature keys + src_ip/dst_ip/flow_start/flow_end/timestamp).
+        Returns (seq of the first record, the record array)."""
+        batch = rows_to_records(rows, self.feature_names, self.dtype)
+        seq = self.write_seq
+        self._write(batch)
+        return seq, batch
+
+    def _write(self, batch):
+        n = len(batch)
+        if not n:
+            return
+        if n > self.capacity:
+            batch = batch[-self.capacity:]
+            self.write_seq += n - self.capacity
+            n = self.capacity
+        start = self.write_seq % self.capacity
+        first = min(n, self.capacity - start)
+        self.records[start:start + first] = batch[:first]
+        if first < n:
+            self.records[:n - first] = batch[first:]
+        self.write_seq += n
+        # publish only after the slots are written
+        _SEQ.pack_into(self.mm, _SEQ_OFF, self.write_seq)
+
+    def close(self):
+        self.records = None
+        _close_map(self.mm)
+        os.close(self.fd)
+
+
+class FeatureRingReader:
+    """Reads records appended since the previous call. Starts at the
+    current write position unless `from_start` (then at the oldest slot)."""
+
+    def __init__(self, path, from_start=False):
+        self.path = path
+        self.from_start = from_start
+        self.mm = None
+        self.ring_id = None
+        self.ino = None
+        self.read_seq = 0
+        self.overruns = 0
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            self.ino = os.fstat(f.fileno()).st_ino
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, ver, rsize, cap, _nfeat, rid = _HDR.unpack_from(self.mm)
+        if magic != MAGIC or ver != VERSION:
+            self.mm.close()
+            self.mm = None
+            return False
+        names = json.loads(bytes(self.mm[_NAMES_OFF:HEADER_SIZE]).rstrip(b"\0"))
+        self.feature_names = names
+        self.dtype = record_dtype(names)
+        self.capacity = cap
+        self.ring_id = rid
+        self.records = np.ndarray((cap,), dtype=self.dtype, buffer=self.mm, offset=HEADER_SIZE)
+        seq = self._write_seq()
+        self.read_seq = max(0, seq - cap) if self.from_start else seq
+        return True
+
+    def _write_seq(self):
+        return _SEQ.unpack_from(self.mm, _SEQ_OFF)[0]
+
+    def watermark(self):
+        """Writer's event-time watermark (0.0 if there is no ring)."""
+        if self.mm is None:
+            return 0.0
+        return _WM.unpack_from(self.mm, _WM_OFF)[0]
+
+    def _check_recreated(self):
+        # the writer only ever replaces the file (os.replace), never resizes it
+        try:
+            return os.stat(self.path).st_ino != self.ino
+        except FileNotFoundError:
+            return True
+
+    def read_new(self):
+        """Return a structured array of new records (may be empty, None if
+        there is no ring yet). Without wrap-around this is a view on the
+        mapping, valid until the writer laps it, so consume it right away.
+        Records the writer already overwrote are skipped and counted."""
+        if self.mm is None or self._check_recreated():
+            if self.mm is not None:
+                self.records = None
+                _close_map(self.mm)
+                self.mm = None
+                self.from_start = True   # new ring: everything in it is new
+            if not self._open():
+                return None
+        cap = self.capacity
+        end = self._write_seq()
+        if end - self.read_seq > cap:
+            self.overruns += end - cap - self.read_seq
+            self.read_seq = end - cap
+        start = self.read_seq
+        if end <= start:
+            return self.records[:0]
+        a, b = start % cap, end % cap
+        if a < b:
+            out = self.records[a:b]
+        else:
+            out = np.concatenate((self.records[a:], self.records[:b]))
+        # drop anything the writer lapped while we were reading
+        lapped = self._write_seq() - cap - start
+        if lapped > 0:
+            out = out[lapped:]
+            self.overruns += lapped
+        self.read_seq = end
+        return out
+
+
+def export_csv(ring_path, out_csv):
+    """Dump every record still in the ring to CSV (for the training scripts)."""
+    import pandas as pd
+    reader = FeatureRingReader(ring_path, from_start=True)
+    recs = reader.read_new()
+    if recs is None:
+        raise FileNotFoundError(ring_path)
+    df = pd.DataFrame({name: recs[name] for name in reader.feature_names})
+    df["src_ip"] = [u32_to_ip(v) for v in recs["src_ip"]]
+    df["dst_ip"] = [u32_to_ip(v) for v in recs["dst_ip"]]
+    for name in ("flow_start", "flow_end", "timestamp"):
+        df[name] = recs[name]
+    df.to_csv(out_csv, index=False)
+    return len(df)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("usage: feature_ring.py RING_FILE OUT_CSV")
+        sys.exit(1)
+    print(f"exported {export_csv(sys.argv[1], sys.argv[2])} rows")
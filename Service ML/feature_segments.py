@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# feature_segments.py  -- time-partitioned feature CSVs with a manifest
+#
+# PCAPWorker writes its rows into one CSV per `span` seconds of processing
+# time (features_YYYYmmddHHMMSS.csv, append only, closed once the span is
+# over) and keeps ROOT/manifest.json:
+#   {"version": 1, "span": 60,
+#    "segments": [{"name", "opened", "closed", "rows", "columns",
+#                  "event_min", "event_max"}, ...]}          oldest first
+# event_min / event_max are the oldest flow_start and newest flow_end in the
+# segment, so a consumer opens only the segments covering the event time it
+# needs (segments_since). A closed segment whose newest event is older than
+# `retain` leaves ROOT: compressed into ARCHIVE/YYYYmmdd/ for training
+# (pandas reads .csv.gz / .csv.zst directly) or, without an archive, deleted.
+# The writer checks this on every write and, via tick(), from the worker's
+# loop, so segments also expire while there is no traffic.
+# The manifest is written with fsync when a segment is opened, closed or
+# retired; row counts and event ranges of the open segment are written
+# (without fsync) at most once per tick(), readers only watch its mtime.
+#
+# Readers follow the open segment with CsvTail, which parses only the
+# complete lines appended since its last call.
+#
+# Concatenate segments (live or archived) into one training CSV:
+#   python feature_segments.py DIR [DIR...] OUT.csv
+import io
+import os
+import sys
+import json
+import time
+import pandas as pd
+from pcap_archive import available_codec, compress_file, SUFFIXES
+
+MANIFEST = "manifest.json"
+SEGMENT_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def segments_since(root, since=None):
+    """Paths of the segments in ROOT with events at or after `since` (epoch,
+    None = all), oldest first; None if ROOT has no manifest."""
+    m = load_manifest(root)
+    if m is None:
+        return None
+    return [os.path.join(root, s["name"]) for s in m["segments"]
+            if since is None or s["event_max"] is None or s["event_max"] >= since]
+
+
+def list_segments(root):
+    """Every segment file under `root` (plain or compressed), oldest first."""
+    out = []
+    for d, _dirs, names in os.walk(root):
+        out.extend(os.path.join(d, n) for n in names
+                   if n.startswith("features_") and n.endswith(SEGMENT_SUFFIXES))
+    return sorted(out, key=os.path.basename)
+
+
+def _event_range(df):
+    lo = df["flow_start"] if "flow_start" in df.columns else df.get("timestamp")
+    hi = df["flow_end"] if "flow_end" in df.columns else df.get("timestamp")
+    if lo is None or hi is None or not len(df):
+        return None, None
+    return float(lo.min()), float(hi.max())
+
+
+class CsvTail:
+    """Follow a CSV that is being appended to, like `tail -f`: read_new()
+    parses only the complete lines added since the last call. A new inode
+    (rotated / replaced) or a shorter file (truncated) starts over at the
+    header. Returns None while there is nothing new or no file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.ino = None
+        self.offset = 0
+        self.header = None
+
+    def read_new(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self.ino or st.st_size < self.offset:
+                self.ino, self.offset, self.header = st.st_ino, 0, None
+            if st.st_size == self.offset:
+                return None
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        end = data.rfind(b"\n") + 1   # a line still being written waits for the next call
+        if not end:
+            return None
+        self.offset += end
+        chunk = data[:end]
+        if self.header is None:
+            nl = chunk.index(b"\n") + 1
+            self.header, chunk = chunk[:nl], chunk[nl:]
+        if not chunk:
+            return None
+        return pd.read_csv(io.BytesIO(self.header + chunk))
+
+
+class SegmentWriter:
+    def __init__(self, root, span=60, retain=900, archive=None, codec="zstd", level=3,
+                 on_error=None, on_retire=None):
+        self.root = root
+        self.span = span
+        self.retain = retain          # detik of event time a segment stays in root
+        self.archive = archive        # None / "" = delete expired segments
+        self.codec = available_codec(codec) if archive else None
+        self.level = level
+        self.on_error = on_error      # on_error(name, exc)
+        self.on_retire = on_retire    # on_retire(name, archived_path or None)
+        os.makedirs(root, exist_ok=True)
+        m = load_manifest(root)
+        self.segments = m["segments"] if m else []
+        self.dirty = False            # rows written since the manifest was
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def current(self):
+        if self.segments and self.segments[-1]["closed"] is None:
+            return self.segments[-1]
+        return None
+
+    def _layout(self):
+        seg = self.current
+        return seg["name"] if seg is not None else None, len(self.segments)
+
+    def _open(self, now, cols):
+        start = now - now % self.span
+        base = time.strftime("features_%Y%m%d%H%M%S", time.localtime(start))
+        names = {s["name"] for s in self.segments}
+        name, n = base + ".csv", 0
+        while name in names or os.path.exists(os.path.join(self.root, name)):
+            n += 1                    # columns changed within the same span
+            name = f"{base}_{n}.csv"
+        seg = {"name": name, "opened": start, "closed": None, "rows": 0, "columns": cols,
+               "event_min": None, "event_max": None}
+        self.segments.append(seg)
+        return seg
+
+    def write(self, df, now=None):
+        """Append a DataFrame of rows (columns in their final order) to the
+        current segment, starting a new one when the span is over or the
+        columns changed. Returns the segment path."""
+        now = time.time() if now is None else now
+        before = self._layout()
+        cols = list(df.columns)
+        seg = self.current
+        if seg is not None and (now >= seg["opened"] + self.span or seg["columns"] != cols):
+            seg["closed"] = now
+            seg = None
+        if seg is None:
+            seg = self._open(now, cols)
+        path = os.path.join(self.root, seg["name"])
+        df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+        seg["rows"] += len(df)
+        lo, hi = _event_range(df)
+        if lo is not None:
+            seg["event_min"] = lo if seg["event_min"] is None else min(seg["event_min"], lo)
+            seg["event_max"] = hi if seg["event_max"] is None else max(seg["event_max"], hi)
+        self.expire(now)
+        if self._layout() != before:
+            self.save()
+        else:
+            self.dirty = True
+        return path
+
+    def expire(self, now=None):
+        """Close a segment whose span is over and retire closed segments
+        with no event newer than `retain`. Returns how many were retired."""
+        now = time.time() if now is None else now
+        seg = self.current
+        if seg is not None and now >= seg["opened"] + self.span:
+            seg["closed"] = now
+        keep, n = [], 0
+        for s in self.segments:
+            newest = s["event_max"] if s["event_max"] is not None else s["opened"] + self.span
+            if s["closed"] is None or newest >= now - self.retain:
+                keep.append(s)
+                continue
+            try:
+                dst = self._retire(s)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(s["name"], e)
+                keep.append(s)
+                continue
+            n += 1
+            if self.on_retire is not None:
+                self.on_retire(s["name"], dst)
+        self.segments = keep
+        return n
+
+    def tick(self, now=None):
+        """Loop tick: expire() and save the manifest if a segment was closed
+        or retired, or (without fsync) if rows were written since the last
+        save. Returns how many were retired."""
+        before = self._layout()
+        n = self.expire(now)
+        if self._layout() != before:
+            self.save()
+        elif self.dirty:
+            self.save(sync=False)
+        return n
+
+    def close(self):
+        if self.dirty:
+            self.save()
+
+    def _retire(self, s):
+        src = os.path.join(self.root, s["name"])
+        if not os.path.exists(src):
+            return None
+        dst = None
+        if self.archive:
+            day = time.strftime("%Y%m%d", time.localtime(s["opened"]))
+            dst = os.path.join(self.archive, day, s["name"] + SUFFIXES[self.codec])
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            compress_file(src, dst, self.codec, self.level)
+        os.unlink(src)
+        return dst
+
+    def save(self, sync=True):
+        path = os.path.join(self.root, MANIFEST)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "span": self.span, "segments": self.segments}, f, separators=(",", ":"))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.dirty = False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: feature_segments.py DIR [DIR...] OUT.csv")
+        sys.exit(1)
+    files = [p for d in sys.argv[1:-1] for p in list_segments(d)]
+    if not files:
+        print("[WARN] no feature segments found")
+        sys.exit(1)
+    df = pd.concat((pd.read_csv(p) for p in files), ignore_index=True)
+    df.to_csv(sys.argv[-1], index=False)
+    print(f"[OK] {len(files)} segments, {len(df)} rows -> {sys.argv[-1]}")
+    sys.exit(0)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# flow_snapshot.py  -- restart snapshot of PCAPWorker's in-flight state
+#
+# One binary file holds the open flows of one or more FlowTables (LRU and
+# closing order kept) plus a small JSON "inputs" part: where the input
+# stands (processed checkpoint sequence, follow-mode file offset, backlog
+# edge). Layout, little endian:
+#   header : magic "PWSNAP", version u16, crc32 u32 of the body, created f8,
+#            body length u32
+#   body   : meta length u32, meta JSON {"inputs": {...}, "tables": [...]},
+#            then per table its flow records (FLOW_DTYPE, 204 bytes each) and
+#            u32 indices of the flows in closing order
+# It is written to <path>.tmp, fsynced and renamed over <path>, so a crash
+# leaves either the old or the new snapshot; a torn or foreign file fails
+# the crc/magic check and load_snapshot raises SnapshotError.
+import os
+import json
+import time
+import math
+import zlib
+import socket
+import struct
+from array import array
+from operator import attrgetter
+import numpy as np
+from flow_table import Flow
+
+MAGIC = b"PWSNAP"
+VERSION = 1
+
+_HDR = struct.Struct("<6sHIdI")
+_U32 = struct.Struct("<I")
+_DIR_FIELDS = ("n", "bytes", "len_min", "len_max", "len_mean", "len_m2", "hdr_sum", "pay_min")
+_TS_FIELDS = ("fin_fwd_ts", "fin_bwd_ts", "rst_ts", "closed_at")   # None <-> NaN
+_FIELDS = (("track", "evicted", "weight", "first_ts", "last_ts", "iat_max") + _TS_FIELDS + ("first_flags",)
+           + tuple(d + n for d in ("fwd_", "bwd_") for n in _DIR_FIELDS))
+# one flow record: key (client ip, server ip, server port, client port),
+# then the Flow slots in _FIELDS order
+FLOW_DTYPE = np.dtype(
+    [("client", "V4"), ("server", "V4"), ("sport", "<u2"), ("cport", "<u2"),
+     ("track", "u1"), ("evicted", "u1"), ("weight", "<u4")]
+    + [(n, "<f8") for n in ("first_ts", "last_ts", "iat_max") + _TS_FIELDS]
+    + [("first_flags", "<u2")]
+    + [(d + n, "<f8" if n in ("len_mean", "len_m2") else "<i8") for d in ("fwd_", "bwd_") for n in _DIR_FIELDS])
+_get = attrgetter("key", *_FIELDS)
+_TS = slice(7, 11)     # _TS_FIELDS in a record tuple
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _records(flows):
+    aton, nan = socket.inet_aton, math.nan
+    recs = []
+    for f in flows:
+        v = _get(f)
+        c, s, sport, cport = v[0]
+        recs.append((aton(c), aton(s), sport, cport) + v[1:7]
+                    + tuple(nan if x is None else x for x in v[_TS]) + v[11:])
+    return np.array(recs, dtype=FLOW_DTYPE)
+
+
+def _flows(recs):
+    ntoa = socket.inet_ntoa
+    out = []
+    for v in recs.tolist():
+        f = Flow((ntoa(v[0]), ntoa(v[1]), v[2], v[3]), v[7], track=v[4])
+        for name, x in zip(_FIELDS, v[4:]):
+            setattr(f, name, x)
+        for name in _TS_FIELDS:
+            x = getattr(f, name)
+            if x != x:
+                setattr(f, name, None)
+        f.evicted = bool(f.evicted)
+        out.append(f)
+    return out
+
+
+def save_snapshot(path, tables, inputs):
+    """Write `tables` ({name: FlowTable}) and the `inputs` dict (JSON-able)
+    atomically to `path`. Returns the file size."""
+    metas, parts = [], []
+    for name, t in tables.items():
+        flows = list(t.flows.values())
+        index = {id(f): i for i, f in enumerate(flows)}
+        metas.append({"name": name, "clock": t.clock, "overloaded": t.overloaded,
+                      "evicted": t.evicted, "shed_packets": t.shed_packets,
+                      "flows": len(flows), "closing": len(t.closing)})
+        parts.append(_records(flows).tobytes())
+        parts.append(array("I", (index[id(f)] for f in t.closing.values())).tobytes())
+    meta = json.dumps({"inputs": inputs, "tables": metas}, separators=(",", ":")).encode()
+    body = b"".join([_U32.pack(len(meta)), meta] + parts)
+    tmp = path + ".tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(_HDR.pack(MAGIC, VERSION, zlib.crc32(body), time.time(), len(body)))
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return _HDR.size + len(body)
+
+
+def load_snapshot(path):
+    """Read a snapshot. Returns (inputs, created, tables) where tables maps
+    name -> state for restore_table(). Raises SnapshotError if the file is
+    not a complete snapshot of this version."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HDR.size:
+        raise SnapshotError("truncated header")
+    magic, version, crc, created, n = _HDR.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError(f"not a version {VERSION} snapshot")
+    body = memoryview(data)[_HDR.size:]
+    if len(body) != n or zlib.crc32(body) != crc:
+        raise SnapshotError("checksum mismatch")
+    (mlen,) = _U32.unpack_from(body)
+    meta = json.loads(bytes(body[4:4 + mlen]))
+    off = 4 + mlen
+    tables = {}
+    for m in meta["tables"]:
+        flows = _flows(np.frombuffer(body, FLOW_DTYPE, m["flows"], off))
+        off += FLOW_DTYPE.itemsize * m["flows"]
+        closing = array("I")
+        closing.frombytes(body[off:off + 4 * m["closing"]])
+        off += 4 * m["closing"]
+        tables[m["name"]] = dict(m, flows=flows, closing=closing)
+    return meta["inputs"], created, tables
+
+
+def restore_table(table, state):
+    """Load a table state from load_snapshot() into an empty FlowTable.
+    Raises SnapshotError if the flows lack accumulators the table's track
+    needs (the model's feature list changed). Returns the flow count."""
+    for f in state["flows"]:
+        if table.track & ~f.track:
+            raise SnapshotError("flows were tracked for a different feature plan")
+    flows = state["flows"]
+    for f in flows:
+        table.flows[f.key] = f
+    for i in state["closing"]:
+        table.closing[flows[i].key] = flows[i]
+    table.clock = state["clock"]
+    table.overloaded = state["overloaded"]
+    table.evicted = state["evicted"]
+    table.shed_packets = state["shed_packets"]
+    return len(flows)
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# flow_table.py  -- persistent TCP flow table for PCAPWorker
+#
+# Flows live across rotated pcap files and are only handed back once they are
+# finished, CICFlowMeter style:
+#   - RST, or FIN seen in both directions (after a short linger for the last ACK)
+#   - idle timeout: no packet for FLOW_IDLE_TIMEOUT seconds
+#   - active timeout: flow older than FLOW_ACTIVE_TIMEOUT is cut and restarted
+# The table clock is packet time; expire() can also be driven by wall clock.
+#
+# Overload (SYN / connection flood): with max_flows set the table never holds
+# more flows than that. At the cap the least recently active flow is cut and
+# handed back early (Flow.evicted, a partial row), and with sample_every = N
+# only 1 in N new connections is tracked until the table drains below
+# OVERLOAD_LOW_WATER of the cap. The choice hashes the connection key, so
+# every process (pool workers included) keeps the same connections; tracked
+# ones carry weight N so counts over flows can be scaled back up. Per-flow
+# features stay exact, a sampled connection is still seen in full.
+import zlib
+from collections import OrderedDict
+
+FLOW_IDLE_TIMEOUT = 15.0     # detik tanpa paket -> flow selesai
+FLOW_ACTIVE_TIMEOUT = 120.0  # flow lebih lama dari ini dipotong (CICFlowMeter default)
+FLOW_CLOSE_LINGER = 1.0      # tunggu ACK terakhir setelah FIN/FIN atau RST
+OVERLOAD_LOW_WATER = 0.9     # leave overload mode below this fraction of max_flows
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# optional per-flow accumulators; a FeaturePlan (feature_registry) asks only
+# for the ones its features need. Counts, first/last time and FIN/RST state
+# are always kept, the flow lifecycle depends on them.
+TRACK_BYTES = 0x01       # byte sums per direction
+TRACK_LEN_MIN = 0x02     # min frame length per direction
+TRACK_LEN_MAX = 0x04     # max frame length per direction
+TRACK_LEN_VAR = 0x08     # Welford mean/M2 of frame length per direction
+TRACK_HDR = 0x10         # tcp header length sums
+TRACK_PAY_MIN = 0x20     # min tcp payload per direction
+TRACK_IAT = 0x40         # max inter-arrival time
+TRACK_ALL = 0x7f
+
+
+def flow_sampled(key, every):
+    """Deterministic 1-in-`every` choice of a connection (stable across
+    processes and restarts, unlike hash())."""
+    return zlib.crc32("|".join(map(str, key)).encode()) % every == 0
+
+
+class Flow:
+    """Constant-size flow record: running counters per direction instead of
+    a list of packets. Only the accumulators selected by `track` (TRACK_*)
+    are updated; the others stay 0. Length variance uses Welford."""
+    __slots__ = (
+        "key", "track", "weight", "evicted", "first_ts", "last_ts", "iat_max", "first_flags",
+        "fin_fwd_ts", "fin_bwd_ts", "rst_ts", "closed_at",
+        "fwd_n", "fwd_bytes", "fwd_len_min", "fwd_len_max", "fwd_len_mean", "fwd_len_m2",
+        "fwd_hdr_sum", "fwd_pay_min",
+        "bwd_n", "bwd_bytes", "bwd_len_min", "bwd_len_max", "bwd_len_mean", "bwd_len_m2",
+        "bwd_hdr_sum", "bwd_pay_min",
+    )
+
+    def __init__(self, key, ts, flags=0, track=TRACK_ALL):
+        self.key = key            # (client_ip, server_ip, server_port, client_port)
+        self.track = track
+        self.weight = 1           # connections this record stands for (sampling)
+        self.evicted = False      # cut early by the table cap, counters are partial
+        self.first_ts = ts
+        self.last_ts = ts
+        self.iat_max = 0.0
+        self.first_flags = flags  # tcp flags of the first packet
+        self.fin_fwd_ts = None    # first FIN per direction / first RST
+        self.fin_bwd_ts = None
+        self.rst_ts = None
+        self.closed_at = None     # RST or second FIN
+        self.fwd_n = self.bwd_n = 0
+        self.fwd_bytes = self.bwd_bytes = 0
+        self.fwd_len_min = self.bwd_len_min = 0
+        self.fwd_len_max = self.bwd_len_max = 0
+        self.fwd_len_mean = self.bwd_len_mean = 0.0
+        self.fwd_len_m2 = self.bwd_len_m2 = 0.0
+        self.fwd_hdr_sum = self.bwd_hdr_sum = 0
+        self.fwd_pay_min = self.bwd_pay_min = 0
+
+    def add(self, item):
+        ts, plen, direction, flags, _win, hdr_len, payload_len = item
+        track = self.track
+        if ts > self.last_ts:
+            # packets arrive in capture order; an out-of-order one only
+            # widens the first/last bounds and never shrinks the IAT max
+            if track & TRACK_IAT:
+                gap = ts - self.last_ts
+                if gap > self.iat_max:
+                    self.iat_max = gap
+            self.last_ts = ts
+        elif ts < self.first_ts:
+            self.first_ts = ts
+        if direction == 'fwd':
+            n = self.fwd_n = self.fwd_n + 1
+            if track & TRACK_BYTES:
+                self.fwd_bytes += plen
+            if track & TRACK_HDR:
+                self.fwd_hdr_sum += hdr_len
+            if n == 1:
+                self.fwd_len_min = self.fwd_len_max = plen
+                self.fwd_pay_min = payload_len
+            else:
+                if track & TRACK_LEN_MIN and plen < self.fwd_len_min:
+                    self.fwd_len_min = plen
+                if track & TRACK_LEN_MAX and plen > self.fwd_len_max:
+                    self.fwd_len_max = plen
+                if track & TRACK_PAY_MIN and payload_len < self.fwd_pay_min:
+                    self.fwd_pay_min = payload_len
+            if track & TRACK_LEN_VAR:
+                delta = plen - self.fwd_len_mean
+                self.fwd_len_mean += delta / n
+                self.fwd_len_m2 += delta * (plen - self.fwd_len_mean)
+            if flags & TCP_FIN and self.fin_fwd_ts is None:
+                self.fin_fwd_ts = ts
+        else:
+            n = self.bwd_n = self.bwd_n + 1
+            if track & TRACK_BYTES:
+                self.bwd_bytes += plen
+            if track & TRACK_HDR:
+                self.bwd_hdr_sum += hdr_len
+            if n == 1:
+                self.bwd_len_min = self.bwd_len_max = plen
+                self.bwd_pay_min = payload_len
+            else:
+                if track & TRACK_LEN_MIN and plen < self.bwd_len_min:
+                    self.bwd_len_min = plen
+                if track & TRACK_LEN_MAX and plen > self.bwd_len_max:
+                    self.bwd_len_max = plen
+                if track & TRACK_PAY_MIN and payload_len < self.bwd_pay_min:
+                    self.bwd_pay_min = payload_len
+            if track & TRACK_LEN_VAR:
+                delta = plen - self.bwd_len_mean
+                self.bwd_len_mean += delta / n
+                self.bwd_len_m2 += delta * (plen - self.bwd_len_mean)
+            if flags & TCP_FIN and self.fin_bwd_ts is None:
+                self.fin_bwd_ts = ts
+        if flags & TCP_RST and self.rst_ts is None:
+            self.rst_ts = ts
+        if self.closed_at is None and (flags & (TCP_FIN | TCP_RST)):
+            self._update_closed()
+
+    def _update_closed(self):
+        ends = []
+        if self.rst_ts is not None:
+            ends.append(self.rst_ts)
+        if self.fin_fwd_ts is not None and self.fin_bwd_ts is not None:
+            ends.append(max(self.fin_fwd_ts, self.fin_bwd_ts))
+        self.closed_at = min(ends) if ends else None
+
+    def merge(self, other):
+        """Fold in a later segment of the same connection (e.g. computed by
+        a pool worker from the next file). Welford parts use Chan's update."""
+        gap = other.first_ts - self.last_ts
+        self.weight = max(self.weight, other.weight)
+        self.evicted = self.evicted or other.evicted
+        self.iat_max = max(self.iat_max, other.iat_max, gap if gap > 0 else 0.0)
+        if other.first_ts < self.first_ts:
+            self.first_ts = other.first_ts
+            self.first_flags = other.first_flags
+        self.last_ts = max(self.last_ts, other.last_ts)
+        for f in ("fin_fwd_ts", "fin_bwd_ts", "rst_ts"):
+            a, b = getattr(self, f), getattr(other, f)
+            if a is None or (b is not None and b < a):
+                setattr(self, f, b)
+        self._update_closed()
+        for d in ("fwd_", "bwd_"):
+            n2 = getattr(other, d + "n")
+            if not n2:
+                continue
+            n1 = getattr(self, d + "n")
+            if not n1:
+                for f in ("n", "bytes", "len_min", "len_max", "len_mean", "len_m2", "hdr_sum", "pay_min"):
+                    setattr(self, d + f, getattr(other, d + f))
+                continue
+            n = n1 + n2
+            m1 = getattr(self, d + "len_mean")
+            delta = getattr(other, d + "len_mean") - m1
+            setattr(self, d + "len_m2", getattr(self, d + "len_m2") + getattr(other, d + "len_m2")
+                    + delta * delta * n1 * n2 / n)
+            setattr(self, d + "len_mean", m1 + delta * n2 / n)
+            setattr(self, d + "n", n)
+            for f in ("bytes", "hdr_sum"):
+                setattr(self, d + f, getattr(self, d + f) + getattr(other, d + f))
+            for f in ("len_min", "pay_min"):
+                setattr(self, d + f, min(getattr(self, d + f), getattr(other, d + f)))
+            setattr(self, d + "len_max", max(getattr(self, d + "len_max"), getattr(other, d + "len_max")))
+
+    @property
+    def packets(self):
+        return self.fwd_n + self.bwd_n
+
+    @property
+    def duration(self):
+        return self.last_ts - self.first_ts
+
+
+class FlowTable:
+    def __init__(self, idle_timeout=FLOW_IDLE_TIMEOUT, active_timeout=FLOW_ACTIVE_TIMEOUT,
+                 close_linger=FLOW_CLOSE_LINGER, track=TRACK_ALL, max_flows=0, sample_every=0):
+        self.track = track
+        self.max_flows = max_flows        # 0 = unbounded
+        self.sample_every = sample_every  # 1-in-N new connections while overloaded, 0/1 = off
+        self.overloaded = False
+        self.evicted = 0                  # flows cut early because of the cap
+        self.shed_packets = 0             # packets of connections not sampled
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.close_linger = close_linger
+        self.flows = OrderedDict()   # key -> Flow, least recently active first
+        self.closing = OrderedDict() # key -> Flow, in closing order
+        self.clock = 0.0
+
+    def __len__(self):
+        return len(self.flows)
+
+    def add(self, key, item):
+        """Feed one packet. Returns the list of flows finished by it."""
+        ts = item[0]
+        done = []
+        flow = self.flows.get(key)
+        if flow is not None and self._splits(flow, ts, ts, item[3]):
+            done.append(self._pop(key))
+            flow = None
+        if flow is None:
+            weight = self._admit(key, done) if self.max_flows else 1
+            if not weight:
+                self.shed_packets += 1
+                return done
+            flow = Flow(key, ts, item[3], self.track)
+            flow.weight = weight
+            self.flows[key] = flow
+        else:
+            self.flows.move_to_end(key)
+        was_closed = flow.closed_at is not None
+        flow.add(item)
+        if not was_closed and flow.closed_at is not None:
+            self.closing[key] = flow
+        if ts > self.clock:
+            self.clock = ts
+        return done
+
+    def merge(self, seg, finished):
+        """Merge a pre-aggregated segment (see Flow.merge). Segments of one
+        key must arrive in time order. Returns the flows that are done."""
+        key = seg.key
+        done = []
+        flow = self.flows.get(key)
+        if flow is not None:
+            if not self._splits(flow, seg.first_ts, seg.last_ts, seg.first_flags):
+                flow.merge(seg)
+                self.flows.move_to_end(key)
+                if finished:
+                    done.append(self._pop(key))
+                elif flow.closed_at is not None and key not in self.closing:
+                    self.closing[key] = flow
+                if flow.last_ts > self.clock:
+                    self.clock = flow.last_ts
+                return done
+            done.append(self._pop(key))
+        if self.max_flows:
+            weight = self._admit(key, done, slot=not finished)
+            if not weight:
+                self.shed_packets += seg.packets
+                return done
+            seg.weight = max(seg.weight, weight)
+        if finished:
+            done.append(seg)
+        else:
+            self.flows[key] = seg
+            if seg.closed_at is not None:
+                self.closing[key] = seg
+        if seg.last_ts > self.clock:
+            self.clock = seg.last_ts
+        return done
+
+    def adopt(self, flows):
+        """Take over open flows from an earlier stretch of the same capture
+        (a drained backlog table). A connection this table also holds
+        becomes one flow if the gap allows it (the earlier part is merged
+        in front), otherwise the earlier part is done. Adopted flows go to
+        the least recently active end, expire() finishes them as usual.
+        Returns the flows that are done."""
+        done = []
+        for old in reversed(flows):
+            key = old.key
+            cur = self.flows.get(key)
+            if cur is not None:
+                if self._splits(old, cur.first_ts, cur.last_ts, cur.first_flags):
+                    done.append(old)
+                    continue
+                old.merge(cur)
+                self.flows[key] = old
+                if key in self.closing or old.closed_at is not None:
+                    self.closing[key] = old
+                continue
+            self.flows[key] = old
+            self.flows.move_to_end(key, last=False)
+            if old.closed_at is not None:
+                self.closing[key] = old
+                self.closing.move_to_end(key, last=False)
+            if old.last_ts > self.clock:
+                self.clock = old.last_ts
+        return done
+
+    def _admit(self, key, done, slot=True):
+        """Overload control for a connection the table doesn't hold yet.
+        Returns its weight, or 0 if it is not sampled. Makes room by evicting
+        the least recently active flow into `done` when `slot` is needed."""
+        self._check_overload()
+        if not self.overloaded:
+            return 1
+        weight = 1
+        if self.sample_every > 1:
+            if not flow_sampled(key, self.sample_every):
+                return 0
+            weight = self.sample_every
+        if slot and len(self.flows) >= self.max_flows:
+            old = self._pop(next(iter(self.flows)))
+            old.evicted = True
+            self.evicted += 1
+            done.append(old)
+        return weight
+
+    def _check_overload(self):
+        n = len(self.flows)
+        if self.overloaded:
+            if n < self.max_flows * OVERLOAD_LOW_WATER:
+                self.overloaded = False
+        elif self.max_flows and n >= self.max_flows:
+            self.overloaded = True
+
+    def _splits(self, flow, first_ts, last_ts, first_flags):
+        """True if traffic starting at first_ts (up to last_ts) can't belong
+        to `flow`: idle gap, active timeout, or a fresh SYN after close.
+        Closing by FIN/RST + linger is left to expire(), so feeding packets
+        one by one and merging per-file segments give the same flows."""
+        return (first_ts - flow.last_ts > self.idle_timeout
+                or last_ts - flow.first_ts > self.active_timeout
+                or (flow.closed_at is not None and (first_flags & (TCP_SYN | TCP_ACK)) == TCP_SYN))
+
+    def expire(self, now=None):
+        """Return flows that are closed or idle at time `now` (default: packet clock)."""
+        if now is None:
+            now = self.clock
+        done = []
+        while self.closing:
+            key, flow = next(iter(self.closing.items()))
+            if flow.closed_at + self.close_linger > now:
+                break
+            done.append(self._pop(key))
+        while self.flows:
+            key, flow = next(iter(self.flows.items()))
+            if flow.last_ts + self.idle_timeout > now:
+                break
+            done.append(self._pop(key))
+        if self.overloaded:
+            self._check_overload()
+        return done
+
+    def watermark(self, input_time=None):
+        """Event time every flow still to come out of the table ends at or
+        after: the last packet of the least recently active open flow, or
+        the input position (default: packet clock) if that is older."""
+        wm = self.clock if input_time is None else input_time
+        if self.flows:
+            wm = min(wm, next(iter(self.flows.values())).last_ts)
+        return wm
+
+    def flush(self):
+        """Finish every open flow (shutdown / end of offline extraction)."""
+        done = list(self.flows.values())
+        self.flows.clear()
+        self.closing.clear()
+        self.overloaded = False
+        return done
+
+    def _pop(self, key):
+        self.closing.pop(key, None)
+        return self.flows.pop(key)
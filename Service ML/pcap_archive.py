@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# pcap_archive.py  -- compressed archive of processed pcaps for PCAPWorker
+#
+# Processed rotation files are moved out of the tcpdump directory into
+#   ARCHIVE_DIR/YYYYmmdd/ssh_YYYYmmddHHMMSS.pcap.zst   (or .pcap.gz)
+# compressed as a stream (1 MiB chunks, never the whole file in memory) by a
+# background thread, so the extractor never waits for it. The archive has a
+# byte budget; when it is exceeded the oldest captures (by rotation stamp)
+# are deleted first. pcap_reader.read_capture() reads these files directly,
+# so a whole archive can be re-extracted for training (PCAPWorker --extract).
+#
+# zstd needs the `zstandard` package; without it gzip (stdlib) is used.
+import os
+import time
+import gzip
+import queue
+import bisect
+import shutil
+import threading
+from processed_store import rotation_stamp
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK = 1 << 20
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+CAPTURE_SUFFIXES = (".pcap", ".pcap.gz", ".pcap.zst")
+
+
+def available_codec(codec):
+    """`codec` if it can be used here, else gzip."""
+    if codec == "zstd" and zstandard is None:
+        return "gzip"
+    if codec not in SUFFIXES:
+        raise ValueError(f"unknown archive codec {codec!r}")
+    return codec
+
+
+def compress_file(src, dst, codec="zstd", level=3):
+    """Stream-compress src into dst (written to dst.tmp, then renamed)."""
+    tmp = dst + ".tmp"
+    with open(src, "rb") as fi:
+        if codec == "zstd":
+            with open(tmp, "wb") as fo:
+                zstandard.ZstdCompressor(level=level).copy_stream(fi, fo, read_size=CHUNK, write_size=CHUNK)
+        else:
+            with open(tmp, "wb") as raw, gzip.GzipFile(os.path.basename(src), "wb", level, raw, 0) as fo:
+                shutil.copyfileobj(fi, fo, CHUNK)
+    os.replace(tmp, dst)
+
+
+def list_captures(root):
+    """Every pcap under `root` (plain or compressed), in rotation order."""
+    out = []
+    for d, _dirs, names in os.walk(root):
+        out.extend(os.path.join(d, n) for n in names if n.endswith(CAPTURE_SUFFIXES))
+    return sorted(out, key=lambda p: (rotation_stamp(p), os.path.basename(p)))
+
+
+class PcapArchive:
+    def __init__(self, root, budget, codec="zstd", level=3, on_error=None, on_done=None):
+        self.root = root
+        self.budget = budget          # bytes, 0 = unlimited
+        self.codec = available_codec(codec)
+        self.level = level
+        self.on_error = on_error      # on_error(path, exc)
+        self.on_done = on_done        # on_done(path, raw_size, packed_size, evicted)
+        self.bytes = 0
+        self._index = []              # sorted [(stamp, name, path, size)]
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+        self.enforce_budget()
+        self._thread = threading.Thread(target=self._run, name="pcap-archive", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _scan(self):
+        for p in list_captures(self.root):
+            try:
+                size = os.path.getsize(p)
+            except OSError:
+                continue
+            self._index.append((rotation_stamp(p), os.path.basename(p), p, size))
+            self.bytes += size
+        self._index.sort()
+
+    def target(self, path):
+        name = os.path.basename(path)
+        day = rotation_stamp(name)[:8] or "undated"
+        return os.path.join(self.root, day, name + SUFFIXES[self.codec])
+
+    def submit(self, path):
+        """Queue a processed capture; it is compressed, then removed from
+        its original place. Queuing the same path twice is a no-op."""
+        with self._lock:
+            if path in self._queued:
+                return
+            self._queued.add(path)
+        self._queue.put(path)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self._archive(path)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(path, e)
+            finally:
+                with self._lock:
+                    self._queued.discard(path)
+                self._queue.task_done()
+
+    def _archive(self, path):
+        try:
+            raw = os.path.getsize(path)
+        except FileNotFoundError:
+            return                     # tcpdump -W already recycled it
+        dst = self.target(path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        compress_file(path, dst, self.codec, self.level)
+        os.unlink(path)
+        size = os.path.getsize(dst)
+        entry = (rotation_stamp(dst), os.path.basename(dst), dst, size)
+        i = bisect.bisect_left(self._index, entry[:3])
+        if i < len(self._index) and self._index[i][2] == dst:
+            self.bytes -= self._index[i][3]   # re-archived after a crash
+            self._index[i] = entry
+        else:
+            self._index.insert(i, entry)
+        self.bytes += size
+        evicted = self.enforce_budget()
+        if self.on_done is not None:
+            self.on_done(path, raw, size, evicted)
+
+    def enforce_budget(self):
+        """Delete the oldest captures until the archive fits the budget.
+        Returns how many were removed."""
+        n = 0
+        while self.budget and self.bytes > self.budget and len(self._index) > 1:
+            _stamp, _name, path, size = self._index.pop(0)
+            self.bytes -= size
+            n += 1
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            try:
+                os.rmdir(os.path.dirname(path))   # only succeeds once the day is empty
+            except OSError:
+                pass
+        return n
+
+    def drain(self, timeout):
+        """Wait up to `timeout` s for queued captures (shutdown). Whatever is
+        left stays in the capture directory and is queued again next start."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# pcap_reader.py  -- fast raw-bytes pcap reader used by PCAPWorker
+#
+# Walks the classic libpcap record headers and decodes Ethernet/IPv4/TCP with
+# struct offsets on a memoryview, so no per-packet objects are built.
+# Frames are prefiltered on raw header bytes against a set of watched TCP
+# ports; only packets of watched services are decoded any further.
+# Scapy is only used as a fallback for formats we don't decode here (pcapng,
+# unknown link types). gzip / zstd compressed captures (pcap_archive) are
+# recognised by their magic bytes and decompressed in memory.
+import io
+import os
+import gzip
+import struct
+import socket
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+GLOBAL_HDR_LEN = 24
+RECORD_HDR_LEN = 16
+
+# link types (pcap-linktype(7))
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+IPPROTO_TCP = 6
+
+SSH_PORT = 22
+DEFAULT_PORTS = frozenset((SSH_PORT,))
+
+_U16 = struct.Struct("!H")
+_PORTS_FLAGS_WIN = struct.Struct("!HH8xHH")   # sport dport [seq ack] off+flags win
+
+
+class UnsupportedPcap(Exception):
+    """File is not a classic pcap we can decode ourselves (use scapy)."""
+
+
+class PcapHeader:
+    __slots__ = ("endian", "ts_scale", "snaplen", "linktype", "record")
+
+    def __init__(self, endian, ts_scale, snaplen, linktype):
+        self.endian = endian
+        self.ts_scale = ts_scale
+        self.snaplen = snaplen
+        self.linktype = linktype
+        self.record = struct.Struct(endian + "IIII")
+
+
+def parse_global_header(buf):
+    """Parse the 24-byte pcap global header, raise UnsupportedPcap if unknown."""
+    if len(buf) < GLOBAL_HDR_LEN:
+        raise UnsupportedPcap("short global header")
+    magic_le = struct.unpack_from("<I", buf, 0)[0]
+    magic_be = struct.unpack_from(">I", buf, 0)[0]
+    if magic_le in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        endian, magic = "<", magic_le
+    elif magic_be in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        endian, magic = ">", magic_be
+    else:
+        raise UnsupportedPcap(f"unknown magic 0x{magic_le:08x}")
+    ts_scale = 1e-9 if magic == PCAP_MAGIC_NSEC else 1e-6
+    _vmaj, _vmin, _zone, _sigfigs, snaplen, linktype = struct.unpack_from(endian + "HHiIII", buf, 4)
+    linktype &= 0x0fffffff   # upper bits may carry FCS info
+    if linktype not in (LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_IPV4,
+                        LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2):
+        raise UnsupportedPcap(f"unsupported linktype {linktype}")
+    return PcapHeader(endian, ts_scale, snaplen, linktype)
+
+
+def iter_records(buf, hdr, pos=GLOBAL_HDR_LEN):
+    """Yield (ts, caplen, frame_offset, next_pos) for every complete record.
+
+    Stops silently at a truncated trailing record; the last yielded next_pos
+    is the offset of the first byte not yet consumed.
+    """
+    rec = hdr.record
+    scale = hdr.ts_scale
+    end = len(buf)
+    while pos + RECORD_HDR_LEN <= end:
+        ts_sec, ts_frac, caplen, _origlen = rec.unpack_from(buf, pos)
+        start = pos + RECORD_HDR_LEN
+        nxt = start + caplen
+        if nxt > end:
+            break
+        yield ts_sec + ts_frac * scale, caplen, start, nxt
+        pos = nxt
+
+
+def _l3_offset(buf, off, caplen, linktype):
+    """Return the offset of the IPv4 header inside the frame or -1."""
+    if linktype == LINKTYPE_ETHERNET:
+        if caplen < 14:
+            return -1
+        etype = _U16.unpack_from(buf, off + 12)[0]
+        l3 = off + 14
+        while etype in ETHERTYPE_VLAN:
+            if l3 + 4 > off + caplen:
+                return -1
+            etype = _U16.unpack_from(buf, l3 + 2)[0]
+            l3 += 4
+        return l3 if etype == ETHERTYPE_IPV4 else -1
+    if linktype == LINKTYPE_LINUX_SLL:
+        if caplen < 16:
+            return -1
+        etype = _U16.unpack_from(buf, off + 14)[0]
+        return off + 16 if etype == ETHERTYPE_IPV4 else -1
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if caplen < 20:
+            return -1
+        etype = _U16.unpack_from(buf, off)[0]
+        return off + 20 if etype == ETHERTYPE_IPV4 else -1
+    # raw IP
+    if caplen < 1 or (buf[off] >> 4) != 4:
+        return -1
+    return off
+
+
+def watch_ports(ports):
+    """Normalise a port or an iterable of ports to a frozenset."""
+    if isinstance(ports, int):
+        return frozenset((ports,))
+    return frozenset(int(p) for p in ports)
+
+
+class _AddrCache(dict):
+    """bytes -> dotted quad, brute-force traffic reuses very few addresses."""
+    def __missing__(self, raw):
+        s = socket.inet_ntoa(raw)
+        self[raw] = s
+        return s
+
+
+def classify(buf, off, caplen, ts, linktype, ports, names):
+    """(key, item) for a TCP packet to/from one of `ports`, None otherwise.
+
+    key  = (client_ip, server_ip, server_port, client_port)
+    item = (ts, len, direction, flags, tcp_win, tcp_hdr_len, payload_len)
+
+    Frames are rejected on fixed header bytes (ethertype, IP version and
+    protocol, fragment offset, IHL, TCP ports) before anything is unpacked,
+    so unrelated traffic costs a few byte comparisons and no allocations.
+    """
+    end = off + caplen
+    if (linktype == LINKTYPE_ETHERNET and caplen >= 54
+            and buf[off + 12] == 0x08 and buf[off + 13] == 0x00):
+        l3 = off + 14   # plain Ethernet II / IPv4, by far the common case
+    else:
+        l3 = _l3_offset(buf, off, caplen, linktype)
+        if l3 < 0 or l3 + 20 > end:
+            return None
+    vihl = buf[l3]
+    if (vihl >> 4) != 4 or buf[l3 + 9] != IPPROTO_TCP:
+        return None
+    if (buf[l3 + 6] & 0x1f) or buf[l3 + 7]:
+        return None   # non-first fragment, no TCP header here
+    l4 = l3 + (vihl & 0x0f) * 4
+    if vihl & 0x0f < 5 or l4 + 20 > end:
+        return None
+    dport = (buf[l4 + 2] << 8) | buf[l4 + 3]
+    if dport in ports:
+        direction = 'fwd'
+    else:
+        sport = (buf[l4] << 8) | buf[l4 + 1]
+        if sport not in ports:
+            return None
+        direction = 'bwd'
+    # a watched packet: now decode the rest
+    sport, dport, off_flags, win = _PORTS_FLAGS_WIN.unpack_from(buf, l4)
+    tcp_hdr_len = (off_flags >> 12) * 4
+    flags = off_flags & 0x01ff
+    # same as len(bytes(pkt[TCP].payload)) in scapy: everything after the
+    # TCP header up to the end of the captured frame (incl. link padding)
+    payload_len = max(0, end - l4 - tcp_hdr_len)
+    src = names[bytes(buf[l3 + 12:l3 + 16])]
+    dst = names[bytes(buf[l3 + 16:l3 + 20])]
+    if direction == 'fwd':
+        return (src, dst, dport, sport), (ts, caplen, 'fwd', flags, win, tcp_hdr_len, payload_len)
+    return (dst, src, sport, dport), (ts, caplen, 'bwd', flags, win, tcp_hdr_len, payload_len)
+
+
+def iter_ssh_packets_buf(buf, hdr, pos=GLOBAL_HDR_LEN, ports=DEFAULT_PORTS, addr_cache=None):
+    """Yield (key, item, next_pos) for watched packets in a pcap buffer
+    (see classify for the tuple layout)."""
+    names = addr_cache if addr_cache is not None else _AddrCache()
+    linktype = hdr.linktype
+    ports = watch_ports(ports)
+    for ts, caplen, off, nxt in iter_records(buf, hdr, pos):
+        pkt = classify(buf, off, caplen, ts, linktype, ports, names)
+        if pkt is not None:
+            yield pkt[0], pkt[1], nxt
+
+
+class PcapStream:
+    """Incremental parser for a pcap byte stream (tcpdump -w -, a FIFO, or
+    a file that is still growing). feed() takes arbitrary chunks and returns
+    the SSH packets of every record completed so far; a partial trailing
+    record stays buffered until the rest arrives."""
+
+    def __init__(self, ports=DEFAULT_PORTS):
+        self.ports = watch_ports(ports)
+        self.hdr = None
+        self.buf = bytearray()
+        self.consumed = 0      # stream bytes handed out as complete records
+        self.names = _AddrCache()
+
+    def feed(self, data):
+        self.buf += data
+        pos = 0
+        if self.hdr is None:
+            if len(self.buf) < GLOBAL_HDR_LEN:
+                return []
+            self.hdr = parse_global_header(self.buf)
+            pos = GLOBAL_HDR_LEN
+        out = []
+        end = pos
+        linktype = self.hdr.linktype
+        mv = memoryview(self.buf)
+        try:
+            for ts, caplen, off, nxt in iter_records(mv, self.hdr, pos):
+                pkt = classify(mv, off, caplen, ts, linktype, self.ports, self.names)
+                if pkt is not None:
+                    out.append(pkt)
+                end = nxt
+        finally:
+            mv.release()
+        if end:
+            del self.buf[:end]
+            self.consumed += end
+        return out
+
+
+class PcapTail:
+    """Follow a pcap file that is still being written, like `tail -f`.
+    Only bytes appended since the last call are read; a record cut off at
+    the current end of file stays buffered in the PcapStream until the rest
+    is written. If the file is replaced or shrinks, reading restarts at 0.
+    `offset` continues after a previous tail's .offset in the same file."""
+
+    def __init__(self, path, ports=DEFAULT_PORTS, offset=0):
+        self.path = path
+        self.ports = ports
+        self.f = None
+        self.ino = None
+        self.stream = None
+        self._open()
+        if offset > GLOBAL_HDR_LEN:
+            self.stream.feed(self.f.read(GLOBAL_HDR_LEN))
+            self.f.seek(offset)
+            self.stream.consumed = offset
+
+    def _open(self):
+        if self.f is not None:
+            self.f.close()
+        self.f = open(self.path, "rb")
+        self.ino = os.fstat(self.f.fileno()).st_ino
+        self.stream = PcapStream(self.ports)
+
+    @property
+    def offset(self):
+        """Byte offset just past the last complete packet record."""
+        return self.stream.consumed
+
+    def read_new(self):
+        st = os.stat(self.path)
+        if st.st_ino != self.ino or st.st_size < self.f.tell():
+            self._open()
+        data = self.f.read()
+        return self.stream.feed(data) if data else []
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def read_capture(pcap_path):
+    """Whole capture file as bytes, decompressed if it is gzip or zstd."""
+    with open(pcap_path, "rb") as f:
+        data = f.read()
+    if data[:2] == GZIP_MAGIC:
+        return gzip.decompress(data)
+    if data[:4] == ZSTD_MAGIC:
+        import zstandard   # only needed for zstd archives
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).readall()
+    return data
+
+
+def iter_ssh_packets_fast(pcap_path, ports=DEFAULT_PORTS):
+    """Raw-bytes reader. Raises UnsupportedPcap before yielding anything if
+    the file needs the scapy path."""
+    return iter_ssh_packets_data(read_capture(pcap_path), ports)
+
+
+def iter_ssh_packets_data(data, ports=DEFAULT_PORTS):
+    """Same as iter_ssh_packets_fast for a pcap file already read into memory."""
+    buf = memoryview(data)
+    hdr = parse_global_header(buf)
+    return _drop_pos(iter_ssh_packets_buf(buf, hdr, ports=ports))
+
+
+def _drop_pos(it):
+    for key, item, _nxt in it:
+        yield key, item
+
+
+def iter_ssh_packets_scapy(pcap_path, ports=DEFAULT_PORTS):
+    """Original scapy dissection, kept as fallback and as reference output."""
+    ports = watch_ports(ports)
+    from scapy.utils import PcapReader
+    from scapy.layers.inet import IP, TCP
+    capture = pcap_path
+    if pcap_path.endswith((".gz", ".zst")):
+        capture = io.BytesIO(read_capture(pcap_path))
+    with PcapReader(capture) as rdr:
+        for pkt in rdr:
+            if IP in pkt and TCP in pkt:
+                sport = int(pkt[TCP].sport)
+                dport = int(pkt[TCP].dport)
+                if sport in ports or dport in ports:
+                    ts = float(pkt.time)
+                    plen = int(len(pkt))
+                    src = pkt[IP].src
+                    dst = pkt[IP].dst
+                    flags = int(pkt[TCP].flags)
+                    tcp_win = int(getattr(pkt[TCP], "window", 0))
+                    try:
+                        tcp_hdr_len = int(pkt[TCP].dataofs) * 4
+                    except Exception:
+                        tcp_hdr_len = 0
+                    try:
+                        payload_len = len(bytes(pkt[TCP].payload))
+                    except Exception:
+                        ip_hdr_len = int(getattr(pkt[IP], "ihl", 0)) * 4 if hasattr(pkt[IP], "ihl") else 0
+                        payload_len = max(0, plen - ip_hdr_len - tcp_hdr_len)
+                    if dport in ports:
+                        yield (src, dst, dport, sport), (ts, plen, 'fwd', flags, tcp_win, tcp_hdr_len, payload_len)
+                    else:
+                        yield (dst, src, sport, dport), (ts, plen, 'bwd', flags, tcp_win, tcp_hdr_len, payload_len)
+
+
+def iter_ssh_packets(pcap_path, ports=DEFAULT_PORTS):
+    """Fast path first, scapy when the file format isn't handled natively."""
+    try:
+        return iter_ssh_packets_fast(pcap_path, ports)
+    except UnsupportedPcap:
+        return iter_ssh_packets_scapy(pcap_path, ports)
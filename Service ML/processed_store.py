@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# processed_store.py  -- compact "which pcaps are done" checkpoint for PCAPWorker
+#
+# Replaces the append-only pcap_processed.list. The checkpoint holds:
+#   hwm  : the newest file (rotation stamp from the filename, inode, size)
+#          such that it and every file before it in rotation order are
+#          committed; files below it are skipped without a lookup, the hwm
+#          file itself only while its inode and size match (tcpdump
+#          restarted within the same second rewrites the same name)
+#   done : name -> [inode, size] for committed files above hwm (committed
+#          out of order, e.g. the live edge while a backlog drains) and for
+#          files without a rotation stamp
+# prune() moves hwm up over the committed files of a directory listing and
+# drops the `done` entries it covers or whose file is gone, so `done` stays
+# a handful of entries. A recycled filename has a new inode or size and is
+# therefore not mistaken for an already processed file.
+#   seq  : number of commits so far; a flow snapshot (flow_snapshot.py)
+#          records it to tell whether it matches this checkpoint
+# add() only changes memory; sync() writes the file (tmp + fsync + rename)
+# if anything changed, once per loop turn.
+import os
+import re
+import json
+
+VERSION = 2   # version 1 kept the newest commit in hwm, not a contiguous mark
+
+_STAMP_RE = re.compile(r"(\d{8,})")
+
+
+def rotation_stamp(path):
+    """Rotation timestamp digits from e.g. ssh_20251103121530.pcap ('' if none)."""
+    m = _STAMP_RE.search(os.path.basename(path))
+    return m.group(1) if m else ""
+
+
+class ProcessedCheckpoint:
+    def __init__(self, path, legacy_list=None):
+        self.path = path
+        self.hwm = {"stamp": "", "name": "", "inode": 0, "size": 0}
+        self.done = {}
+        self.seq = 0
+        self.dirty = False
+        self._load(legacy_list)
+
+    def __len__(self):
+        return len(self.done)
+
+    def __contains__(self, f):
+        name = os.path.basename(f)
+        ident = self.done.get(name)
+        if ident is None:
+            if not self.covers(name):
+                return False
+            if name != self.hwm["name"]:
+                return True
+            ident = [self.hwm["inode"], self.hwm["size"]]
+        try:
+            st = os.stat(f)
+        except FileNotFoundError:
+            return True   # gone already, nothing left to do
+        return ident == [st.st_ino, st.st_size]
+
+    def covers(self, name):
+        """True if `name` is at or below the high-water mark."""
+        stamp = rotation_stamp(name)
+        return bool(stamp) and (stamp, name) <= (self.hwm["stamp"], self.hwm["name"])
+
+    def add(self, f):
+        name = os.path.basename(f)
+        try:
+            st = os.stat(f)
+            ident = [st.st_ino, st.st_size]
+        except FileNotFoundError:
+            ident = [0, 0]
+        self.done[name] = ident
+        if name == self.hwm["name"]:
+            # the mark's file was rewritten and processed again
+            self.hwm.update(inode=ident[0], size=ident[1])
+        self.seq += 1
+        self.dirty = True
+
+    def prune(self, existing):
+        """Move hwm up over the committed files of a directory listing
+        (basenames or paths) in rotation order, and forget `done` entries
+        below it or whose file is no longer on disk."""
+        names = sorted({os.path.basename(f) for f in existing}, key=lambda n: (rotation_stamp(n), n))
+        for n in names:
+            stamp = rotation_stamp(n)
+            if not stamp or self.covers(n):
+                continue
+            ident = self.done.get(n)
+            if ident is None:
+                break
+            self.hwm = {"stamp": stamp, "name": n, "inode": ident[0], "size": ident[1]}
+            self.dirty = True
+        present = set(names)
+        stale = [n for n in self.done if n not in present or self.covers(n)]
+        for n in stale:
+            del self.done[n]
+        if stale:
+            self.dirty = True
+
+    def sync(self):
+        """Write the checkpoint if it changed since the last write."""
+        if self.dirty:
+            self.save()
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump({"version": VERSION, "hwm": self.hwm, "done": self.done, "seq": self.seq},
+                      f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def _load(self, legacy_list):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version", 1) >= VERSION:
+                self.hwm.update(data.get("hwm") or {})
+            self.done = {k: list(v) for k, v in (data.get("done") or {}).items()}
+            self.seq = data.get("seq", 0)
+            return
+        if legacy_list and os.path.exists(legacy_list):
+            # one-time migration: keep only entries whose file is still there
+            with open(legacy_list) as f:
+                for line in f:
+                    p = line.strip()
+                    if p and os.path.exists(p):
+                        self.add(p)
+            self.save()
+            os.replace(legacy_list, legacy_list + ".migrated")
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# worker_metrics.py  -- counters, gauges and latency histograms for PCAPWorker
+#
+# Everything lives in one in-process registry. A daemon thread serves it as
+# Prometheus text on http://HOST:PORT/metrics (and /metrics.json), another
+# one writes a JSON snapshot file every few seconds for the Monitor VM, which
+# reads it over SSH like the rest of its data.
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; per-stage timings range from sub-ms (one live chunk) to whole
+# minutes of backlog, capture lag from ~1 s (live) to rotation + idle timeout
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)   # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        i = 0
+        for b in self.bounds:
+            if v <= b:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += v
+        self.count += 1
+
+    def cumulative(self):
+        out, acc = [], 0
+        for c in self.counts:
+            acc += c
+            out.append(acc)
+        return out
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Metrics:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}   # name -> {labels: value}
+        self._gauges = {}
+        self._hists = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        self.observe_many(name, (value,), buckets, **labels)
+
+    def observe_many(self, name, values, buckets=LATENCY_BUCKETS, **labels):
+        with self._lock:
+            series = self._hists.setdefault(name, {})
+            key = _labels(labels)
+            h = series.get(key)
+            if h is None:
+                h = series[key] = Histogram(buckets)
+            for v in values:
+                h.observe(v)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage into <prefix>_stage_seconds{stage=name}."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - t0, stage=name)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for kind, table in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted(table):
+                    full = f"{self.prefix}_{name}"
+                    if name in self._help:
+                        lines.append(f"# HELP {full} {self._help[name]}")
+                    lines.append(f"# TYPE {full} {kind}")
+                    for labels, v in sorted(table[name].items()):
+                        lines.append(f"{full}{_fmt_labels(labels)} {_fmt_value(v)}")
+            for name in sorted(self._hists):
+                full = f"{self.prefix}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for labels, h in sorted(self._hists[name].items()):
+                    for b, c in zip(h.bounds + (float("inf"),), h.cumulative()):
+                        lines.append(f"{full}_bucket{_fmt_labels(labels, [('le', _fmt_value(float(b)))])} {c}")
+                    lines.append(f"{full}_sum{_fmt_labels(labels)} {_fmt_value(h.sum)}")
+                    lines.append(f"{full}_count{_fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Plain dict of everything, histograms as count/sum/mean/buckets."""
+        def key(name, labels):
+            return name + "".join(f".{v}" for _k, v in labels)
+        with self._lock:
+            out = {"time": time.time(), "uptime": time.time() - self.started,
+                   "counters": {}, "gauges": {}, "histograms": {}}
+            for name, series in self._counters.items():
+                for labels, v in series.items():
+                    out["counters"][key(name, labels)] = v
+            for name, series in self._gauges.items():
+                for labels, v in series.items():
+                    out["gauges"][key(name, labels)] = v
+            for name, series in self._hists.items():
+                for labels, h in series.items():
+                    out["histograms"][key(name, labels)] = {
+                        "count": h.count, "sum": h.sum,
+                        "mean": h.sum / h.count if h.count else 0.0,
+                        "buckets": dict(zip([str(b) for b in h.bounds] + ["+Inf"], h.cumulative())),
+                    }
+        return out
+
+    def write_json(self, path, prev=None):
+        """Atomically write snapshot() to `path`, with per-second rates of
+        every counter since `prev` (the previous snapshot). Returns it."""
+        snap = self.snapshot()
+        if prev is not None:
+            dt = snap["time"] - prev["time"]
+            if dt > 0:
+                snap["rates"] = {k: (v - prev["counters"].get(k, 0)) / dt
+                                 for k, v in snap["counters"].items()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snap, f, separators=(",", ":"))
+        os.replace(tmp, path)
+        return snap
+
+
+def serve_http(metrics, host, port):
+    """Start a daemon thread serving /metrics (Prometheus) and /metrics.json."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body = metrics.render().encode()
+                ctype = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body = json.dumps(metrics.snapshot()).encode()
+                ctype = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass   # scrapes every few seconds would flood the worker log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_json_snapshots(metrics, path, interval, on_error=None):
+    """Daemon thread rewriting `path` every `interval` seconds."""
+    def run():
+        prev = None
+        while True:
+            time.sleep(interval)
+            try:
+                prev = metrics.write_json(path, prev)
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+    t = threading.Thread(target=run, name="metrics-json", daemon=True)
+    t.start()
+    return t
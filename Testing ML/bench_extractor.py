@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# bench_extractor.py -- throughput benchmark for the PCAPWorker extractor
+#
+# Generates synthetic captures with gen_ssh_pcap.py (benign sessions only,
+# and one Patator-style stage per THREAD_STEPS level on top of a little
+# benign background), then runs the extractor over each capture in a fresh
+# process and reports packets/s, flows/s and peak RSS. The two paths the
+# service runs:
+#   flow    : feed_pcap_file through one FlowTable (live files)
+#   segment : segment_pcap_file per file, merged into one FlowTable (what
+#             the backlog lane's pool workers and step() do, in one process)
+#
+# Absolute packets/s depend on the host, so every child also times a fixed
+# pure-Python reference loop (struct unpacking and dict updates, the same
+# kind of work as the extractor, see ref_pass) between its passes, and the
+# baseline stores packets/s divided by that reference score. The exit code
+# is 1 if the geometric mean of that ratio over all scenarios of either path
+# drops more than TOLERANCE below bench_baseline.json. The ratio still moves
+# a little between CPUs and Python versions; refresh the baseline after a
+# Python upgrade with
+#   python bench_extractor.py --update-baseline
+#
+# Usage:
+#   python bench_extractor.py [--quick] [--repeat 3] [--tolerance 0.2] [--keep DIR] [--update-baseline]
+import os
+import sys
+import json
+import math
+import time
+import struct
+import shutil
+import platform
+import tempfile
+import argparse
+import resource
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.join(HERE, "..", "Service ML")
+BASELINE = os.path.join(HERE, "bench_baseline.json")
+TOLERANCE = 0.20          # fail below 80% of the baseline packets/s
+MIN_SECONDS = 1.0         # per child run, see run_one
+REF_RECORDS = 20000       # records per pass of the reference loop
+
+sys.path.insert(0, HERE)
+from gen_ssh_pcap import generate, THREAD_STEPS  # noqa: E402
+
+MODES = ("flow", "segment")
+
+
+def scenarios(quick):
+    dur = 15.0 if quick else 60.0
+    out = [("benign", dict(benign=40 if quick else 200, threads=[], stage_duration=dur))]
+    for n in THREAD_STEPS:
+        out.append((f"patator-{n}", dict(benign=5 if quick else 20, threads=[n], stage_duration=dur)))
+    return out
+
+
+_REC = struct.Struct("<IIII")
+_REF_BUF = b"".join(_REC.pack(i // 100, i % 1000000, 60 + i % 1400, 60 + i % 1400)
+                    for i in range(REF_RECORDS))
+
+
+def ref_pass():
+    """Host reference: one pass of a fixed loop that unpacks pcap-style
+    record headers and sums them into a dict; returns its seconds."""
+    t0 = time.perf_counter()
+    acc = {}
+    for off in range(0, len(_REF_BUF), _REC.size):
+        sec, usec, incl, orig = _REC.unpack_from(_REF_BUF, off)
+        k = (sec & 63, incl & 7)
+        acc[k] = acc.get(k, 0) + orig
+    return time.perf_counter() - t0
+
+
+def run_one(capdir, mode):
+    """Child process: extract every pcap in capdir, print a JSON result."""
+    sys.path.insert(0, SERVICE_DIR)
+    import PCAPWorker as W
+    from flow_table import FlowTable
+    W.WORKER_LOG = os.path.join(capdir, "bench_worker.log")
+    with open(os.path.join(capdir, "manifest.json")) as f:
+        packets = json.load(f)["packets"]
+    files = sorted(os.path.join(capdir, n) for n in os.listdir(capdir) if n.endswith(".pcap"))
+    rss_base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    secs, ref_secs, spent = None, None, 0.0
+    while secs is None or spent < MIN_SECONDS:
+        # whole passes until MIN_SECONDS, fastest pass counts (small captures
+        # take milliseconds, a single pass is mostly scheduler noise); a
+        # reference pass in between so both see the same host load
+        dt = ref_pass()
+        ref_secs = dt if ref_secs is None else min(ref_secs, dt)
+        flows = 0
+        t0 = time.perf_counter()
+        table = FlowTable(track=W.PLAN.track)
+        if mode == "segment":
+            for f in files:
+                finished, still_open = W.segment_pcap_file(f, W.WATCH_PORTS, W.PLAN.track)[:2]
+                done = []
+                for seg in finished:
+                    done.extend(table.merge(seg, True))
+                for seg in still_open:
+                    done.extend(table.merge(seg, False))
+                done.extend(table.expire())
+                flows += len(W.rows_from_flows(done))
+        else:
+            for f in files:
+                flows += len(W.feed_pcap_file(table, f))
+        flows += len(W.rows_from_flows(table.flush()))
+        dt = time.perf_counter() - t0
+        spent += dt
+        secs = dt if secs is None else min(secs, dt)
+    print(json.dumps({"packets": packets, "flows": flows, "files": len(files), "seconds": secs,
+                      "ref": REF_RECORDS / max(ref_secs, 1e-9),
+                      "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      "rss_base_kb": rss_base}))
+
+
+def measure(capdir, mode, repeat):
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", capdir, mode],
+                             check=True, capture_output=True, text=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        if best is None or r["seconds"] / r["ref"] < best["seconds"] / best["ref"]:
+            best = r
+    s = max(best["seconds"], 1e-9)
+    return {"pps": best["packets"] / s, "fps": best["flows"] / s, "ref": best["ref"],
+            "pps_ref": best["packets"] / s / best["ref"],
+            "rss_mb": best["rss_kb"] / 1024.0, "rss_delta_mb": (best["rss_kb"] - best["rss_base_kb"]) / 1024.0,
+            "packets": best["packets"], "flows": best["flows"], "seconds": best["seconds"]}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="PCAPWorker extractor throughput benchmark")
+    ap.add_argument("--quick", action="store_true", help="smaller captures (15 s stages)")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per case, best one counts")
+    ap.add_argument("--keep", metavar="DIR", help="write the captures here and keep them")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE,
+                    help=f"allowed slowdown vs baseline (default {TOLERANCE})")
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--run-one", nargs=2, metavar=("CAPDIR", "MODE"), help=argparse.SUPPRESS)
+    a = ap.parse_args()
+    if a.run_one:
+        run_one(*a.run_one)
+        return 0
+
+    root = a.keep or tempfile.mkdtemp(prefix="bench_pcap_")
+    results = {}
+    try:
+        for name, params in scenarios(a.quick):
+            capdir = os.path.join(root, name)
+            if not os.path.exists(os.path.join(capdir, "manifest.json")):
+                generate(capdir, **params)
+            for mode in MODES:
+                r = measure(capdir, mode, a.repeat)
+                results[f"{name}/{mode}"] = r
+                print(f"{name:12s} {mode:7s} {r['packets']:8d} pkts {r['flows']:6d} flows "
+                      f"{r['pps']:10.0f} pkts/s {r['fps']:8.0f} flows/s ref {r['ref']:8.0f}/s "
+                      f"peak RSS {r['rss_mb']:6.1f} MB (+{r['rss_delta_mb']:.1f})")
+    finally:
+        if not a.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    profile = "quick" if a.quick else "full"
+    ref = sorted(r["ref"] for r in results.values())[len(results) // 2]
+    stored = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            stored = json.load(f)
+    if a.update_baseline:
+        stored[profile] = {"host": platform.node(), "python": platform.python_version(),
+                           "time": int(time.time()), "ref": round(ref),
+                           "results": {k: {"pps": round(v["pps"]), "fps": round(v["fps"]),
+                                           "pps_ref": round(v["pps_ref"], 6),
+                                           "rss_mb": round(v["rss_mb"], 1)} for k, v in results.items()}}
+        with open(BASELINE, "w") as f:
+            json.dump(stored, f, indent=1, sort_keys=True)
+        print(f"[OK] baseline '{profile}' written to {BASELINE}")
+        return 0
+
+    base = stored.get(profile)
+    if not base or "ref" not in base:
+        print(f"[WARN] no '{profile}' baseline with a reference score in {BASELINE}, "
+              f"run with --update-baseline")
+        return 0
+    if base.get("python", "").rsplit(".", 1)[0] != platform.python_version().rsplit(".", 1)[0]:
+        print(f"[WARN] baseline was recorded with Python {base.get('python')}, "
+              f"this is {platform.python_version()}")
+    print(f"[INFO] host speed {ref / base['ref']:5.0%} of the baseline host (reference loop)")
+    failed = False
+    ratios = {}
+    for k, r in results.items():
+        b = base["results"].get(k)
+        if not b or not b.get("pps_ref"):
+            continue
+        ratio = r["pps_ref"] / b["pps_ref"]
+        ratios.setdefault(k.split("/")[1], []).append(ratio)
+        status = "OK" if ratio >= 1.0 - a.tolerance else "WARN"
+        print(f"[{status}] {k:20s} {r['pps']:10.0f} pkts/s, {ratio:5.0%} of baseline relative to the reference")
+    # single cases are noisy on a shared VM; the verdict is on the geometric
+    # mean over all scenarios of one extractor path
+    for mode, rs in sorted(ratios.items()):
+        gm = math.exp(sum(math.log(x) for x in rs) / len(rs))
+        status = "OK" if gm >= 1.0 - a.tolerance else "FAIL"
+        failed = failed or status == "FAIL"
+        print(f"[{status}] {mode} overall {gm:5.0%} of baseline packets/s relative to the reference")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
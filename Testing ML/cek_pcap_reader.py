@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# cek_pcap_reader.py -- differential check: raw-bytes pcap reader vs scapy
+#
+# Usage:
+#   python cek_pcap_reader.py file1.pcap [file2.pcap ...]
+#   python cek_pcap_reader.py            (builds a few synthetic pcaps with scapy)
+#
+# Exit code 0 if both readers yield identical (key, item) sequences.
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Service ML"))
+from pcap_reader import iter_ssh_packets_fast, iter_ssh_packets_scapy  # noqa: E402
+
+TS_TOL = 1e-6
+
+
+def compare(pcap_path):
+    fast = list(iter_ssh_packets_fast(pcap_path))
+    ref = list(iter_ssh_packets_scapy(pcap_path))
+    if len(fast) != len(ref):
+        print(f"[FAIL] {pcap_path}: fast={len(fast)} scapy={len(ref)} packets")
+        return False
+    for i, ((k1, a), (k2, b)) in enumerate(zip(fast, ref)):
+        if k1 != k2 or a[1:] != b[1:] or abs(a[0] - b[0]) > TS_TOL:
+            print(f"[FAIL] {pcap_path} packet #{i}:\n  fast ={k1} {a}\n  scapy={k2} {b}")
+            return False
+    print(f"[OK] {pcap_path}: {len(fast)} SSH packets identical")
+    return True
+
+
+def build_samples(outdir):
+    from scapy.all import Ether, Dot1Q, IP, TCP, Raw, UDP, CookedLinux, wrpcap
+
+    client, server = "192.168.67.67", "192.168.67.12"
+    pkts = []
+    t = 1700000000.0
+    for i in range(50):
+        sp = 40000 + (i % 7)
+        pkts.append(Ether() / IP(src=client, dst=server) / TCP(sport=sp, dport=22, flags="S", window=64240))
+        pkts.append(Ether() / IP(src=server, dst=client) / TCP(sport=22, dport=sp, flags="SA", window=65160))
+        pkts.append(Ether() / IP(src=client, dst=server) / TCP(sport=sp, dport=22, flags="A") / Raw(b"x" * (i * 3)))
+        pkts.append(Ether() / IP(src=server, dst=client, options=b"\x01\x01\x01\x00") / TCP(sport=22, dport=sp, flags="PA") / Raw(b"y" * 40))
+        pkts.append(Ether() / Dot1Q(vlan=5) / IP(src=client, dst=server) / TCP(sport=sp, dport=22, flags="FA"))
+        pkts.append(Ether() / IP(src=client, dst="8.8.8.8") / UDP(sport=5353, dport=53))
+        pkts.append(Ether() / IP(src=client, dst=server) / TCP(sport=sp, dport=80))
+    for i, p in enumerate(pkts):
+        p.time = t + i * 0.0137
+
+    paths = []
+    p_usec = os.path.join(outdir, "usec.pcap")
+    wrpcap(p_usec, pkts)
+    paths.append(p_usec)
+    p_nsec = os.path.join(outdir, "nsec.pcap")
+    wrpcap(p_nsec, pkts, nano=True)
+    paths.append(p_nsec)
+    p_be = os.path.join(outdir, "bigendian.pcap")
+    wrpcap(p_be, pkts, endianness=">")
+    paths.append(p_be)
+    # padded short frames (ethernet minimum 60 bytes)
+    p_pad = os.path.join(outdir, "padded.pcap")
+    wrpcap(p_pad, [Ether(bytes(p) + b"\x00" * max(0, 60 - len(p))) for p in pkts])
+    paths.append(p_pad)
+    p_sll = os.path.join(outdir, "sll.pcap")
+    wrpcap(p_sll, [CookedLinux(proto=0x0800) / p[IP] for p in pkts if IP in p])
+    paths.append(p_sll)
+    return paths
+
+
+if __name__ == "__main__":
+    files = sys.argv[1:]
+    tmp = None
+    if not files:
+        tmp = tempfile.TemporaryDirectory()
+        files = build_samples(tmp.name)
+    ok = all([compare(f) for f in files])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# gen_ssh_pcap.py -- synthetic SSH captures for benchmarking PCAPWorker
+#
+# Writes rotated pcaps (ssh_YYYYmmddHHMMSS.pcap, like tcpdump -G) containing
+#   - benign interactive sessions: handshake, key exchange, login, then
+#     keystroke echo traffic with human think times, closed with FIN
+#   - Patator/Hydra-style brute force: THREAD_STEPS stages, each keeping
+#     `threads` connections busy for the stage duration; every connection
+#     does the handshake, key exchange and a few failed password attempts,
+#     then the server drops it
+# Frames are built with struct (Ethernet/IPv4/TCP with timestamp option), no
+# scapy needed, so large captures are quick to make. Same seed = same bytes.
+#
+# Usage:
+#   python gen_ssh_pcap.py OUTDIR [--benign 50] [--threads 4 8 16 32 64]
+#                          [--stage-duration 60] [--rotate 5] [--seed 1]
+import os
+import sys
+import time
+import json
+import heapq
+import random
+import struct
+import socket
+import argparse
+
+VICTIM = "192.168.67.12"
+ATTACKER = "192.168.67.67"
+BENIGN_NET = "192.168.67."        # benign clients .100 - .199
+SSH_PORT = 22
+THREAD_STEPS = [4, 8, 16, 32, 64]  # sama dengan Script ATTACKER
+STAGE_DURATION = 60.0             # detik per stage (script asli: 720)
+ROTATE_SECONDS = 5                # tcpdump -G 5
+START_EPOCH = 1767225600.0        # 2026-01-01 00:00:00 UTC
+
+# SSH message sizes seen on the wire (TCP payload bytes, OpenSSH 9, chacha20)
+BANNER = (21, 43)
+KEXINIT_CLIENT = (1392, 1560)
+KEXINIT_SERVER = (1080, 1128)
+KEX_ECDH_INIT = 48
+KEX_ECDH_REPLY = (460, 520)
+NEWKEYS = 16
+AUTH_REQUEST = (60, 100)          # service request / userauth, encrypted
+AUTH_FAILURE = (36, 52)
+PASSWORD_TRY = (84, 132)
+KEYSTROKE = 36
+ECHO = (36, 100)
+
+_ETH = b"\x08\x00\x27\x00\x00\x02" + b"\x08\x00\x27\x00\x00\x01" + b"\x08\x00"
+_IP = struct.Struct("!BBHHHBBH4s4s")
+_TCP = struct.Struct("!HHIIBBHHH")
+_TCP_OPTS = b"\x01\x01\x08\x0a" + b"\x00" * 8   # NOP NOP timestamps
+_REC = struct.Struct("<IIII")
+
+FIN, SYN, RST, PSH, ACK = 0x01, 0x02, 0x04, 0x08, 0x10
+
+
+def frame(src, dst, sport, dport, seq, ack, flags, payload_len, ipid):
+    tcp_len = _TCP.size + len(_TCP_OPTS)
+    ip = _IP.pack(0x45, 0, 20 + tcp_len + payload_len, ipid & 0xffff, 0x4000, 64, 6, 0, src, dst)
+    tcp = _TCP.pack(sport, dport, seq & 0xffffffff, ack & 0xffffffff, (tcp_len // 4) << 4,
+                    flags, 502, 0, 0)
+    return _ETH + ip + tcp + _TCP_OPTS + b"\x00" * payload_len
+
+
+class Conn:
+    """One TCP connection; emit() appends (ts, frame) to the shared heap."""
+
+    def __init__(self, out, client, server, sport, rng):
+        self.out = out
+        self.c = socket.inet_aton(client)
+        self.s = socket.inet_aton(server)
+        self.sport = sport
+        self.rng = rng
+        self.cseq = rng.getrandbits(32)
+        self.sseq = rng.getrandbits(32)
+        self.ipid = rng.getrandbits(16)
+
+    def emit(self, ts, fwd, flags, n=0):
+        self.ipid += 1
+        if fwd:
+            f = frame(self.c, self.s, self.sport, SSH_PORT, self.cseq, self.sseq, flags, n, self.ipid)
+            self.cseq += n + (1 if flags & (SYN | FIN) else 0)
+        else:
+            f = frame(self.s, self.c, SSH_PORT, self.sport, self.sseq, self.cseq, flags, n, self.ipid)
+            self.sseq += n + (1 if flags & (SYN | FIN) else 0)
+        heapq.heappush(self.out, (ts, len(self.out), f))
+
+    def msg(self, ts, fwd, n, rtt):
+        """Data segment plus the peer's delayed ACK; returns the time after."""
+        if isinstance(n, tuple):
+            n = self.rng.randint(*n)
+        self.emit(ts, fwd, PSH | ACK, n)
+        self.emit(ts + rtt / 2 + 0.00004, not fwd, ACK)
+        return ts + rtt
+
+    def open(self, ts, rtt):
+        self.emit(ts, True, SYN)
+        self.emit(ts + rtt / 2, False, SYN | ACK)
+        ts += rtt
+        self.emit(ts, True, ACK)
+        # banners, key exchange, NEWKEYS
+        ts = self.msg(ts, True, BANNER, rtt)
+        ts = self.msg(ts + 0.002, False, BANNER, rtt)
+        ts = self.msg(ts, True, KEXINIT_CLIENT, rtt)
+        ts = self.msg(ts, False, KEXINIT_SERVER, rtt)
+        ts = self.msg(ts, True, KEX_ECDH_INIT, rtt)
+        ts = self.msg(ts + 0.003, False, KEX_ECDH_REPLY, rtt)
+        ts = self.msg(ts, True, NEWKEYS, rtt)
+        return self.msg(ts, True, AUTH_REQUEST, rtt)
+
+    def close(self, ts, rtt, server_first):
+        self.emit(ts, not server_first, FIN | ACK)
+        self.emit(ts + rtt / 2, server_first, FIN | ACK)
+        self.emit(ts + rtt, not server_first, ACK)
+        return ts + rtt
+
+
+def benign_session(out, rng, t0, client, sport):
+    rtt = rng.uniform(0.0003, 0.002)
+    c = Conn(out, client, VICTIM, sport, rng)
+    ts = c.open(t0, rtt)
+    ts = c.msg(ts, False, AUTH_FAILURE, rtt)     # methods list
+    ts = c.msg(ts + rng.uniform(1.0, 4.0), True, PASSWORD_TRY, rtt)   # human typing password
+    ts = c.msg(ts, False, (28, 36), rtt)         # success
+    ts = c.msg(ts, True, (100, 140), rtt)        # channel open, pty, shell
+    ts = c.msg(ts, False, (400, 1200), rtt)      # motd + prompt
+    for _ in range(rng.randint(20, 400)):
+        ts += rng.expovariate(1 / 0.25) if rng.random() < 0.9 else rng.uniform(2, 20)
+        c.emit(ts, True, PSH | ACK, KEYSTROKE)
+        ts += rtt
+        c.emit(ts, False, PSH | ACK, rng.randint(*ECHO) if rng.random() < 0.05 else KEYSTROKE)
+        if rng.random() < 0.03:   # command output
+            ts = c.msg(ts + 0.01, False, (200, 1400), rtt)
+        c.emit(ts + 0.04, True, ACK)
+    return c.close(ts + rng.uniform(0.5, 3), rtt, server_first=True)
+
+
+def brute_connection(out, rng, t0, sport):
+    rtt = rng.uniform(0.0003, 0.001)
+    c = Conn(out, ATTACKER, VICTIM, sport, rng)
+    ts = c.open(t0, rtt)
+    ts = c.msg(ts, False, AUTH_FAILURE, rtt)
+    for _ in range(rng.randint(1, 3)):          # MaxAuthTries / hydra tasks
+        ts = c.msg(ts + rng.uniform(0.001, 0.01), True, PASSWORD_TRY, rtt)
+        ts = c.msg(ts + rng.uniform(1.5, 2.5), False, AUTH_FAILURE, rtt)   # sshd failure delay
+    if rng.random() < 0.1:
+        c.emit(ts + 0.001, False, RST | ACK)
+        return ts + 0.001
+    return c.close(ts + 0.001, rtt, server_first=rng.random() < 0.5)
+
+
+def generate(outdir, benign=50, threads=THREAD_STEPS, stage_duration=STAGE_DURATION,
+             rotate=ROTATE_SECONDS, seed=1, start=START_EPOCH):
+    """Write the capture to OUTDIR. Returns a summary dict (also saved as
+    OUTDIR/manifest.json): files, packets, SSH connections."""
+    rng = random.Random(seed)
+    heap = []
+    total = stage_duration * len(threads) if threads else stage_duration
+    conns = 0
+    for i in range(benign):
+        t0 = start + rng.uniform(0, total * 0.9)
+        benign_session(heap, rng, t0, BENIGN_NET + str(100 + i % 100), 40000 + rng.randint(0, 20000))
+        conns += 1
+    sport = 32768
+    for k, n in enumerate(threads):
+        s0 = start + k * stage_duration
+        for _ in range(n):
+            ts = s0 + rng.uniform(0, 0.05)
+            while ts < s0 + stage_duration:
+                sport = 32768 + (sport - 32767) % 28000
+                ts = brute_connection(heap, rng, ts, sport) + rng.uniform(0.0005, 0.003)
+                conns += 1
+
+    os.makedirs(outdir, exist_ok=True)
+    files, packets = [], 0
+    f, cur = None, None
+    while heap:
+        ts, _i, fr = heapq.heappop(heap)
+        slot = int(ts - (ts - start) % rotate)
+        if slot != cur:
+            if f is not None:
+                f.close()
+            name = time.strftime("ssh_%Y%m%d%H%M%S.pcap", time.gmtime(slot))
+            f = open(os.path.join(outdir, name), "wb")
+            f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 262144, 1))
+            files.append(name)
+            cur = slot
+        sec, usec = divmod(int(round(ts * 1e6)), 1000000)
+        f.write(_REC.pack(sec, usec, len(fr), len(fr)))
+        f.write(fr)
+        packets += 1
+    if f is not None:
+        f.close()
+    summary = {"files": len(files), "packets": packets, "connections": conns,
+               "benign": benign, "threads": list(threads), "stage_duration": stage_duration,
+               "rotate": rotate, "seed": seed}
+    with open(os.path.join(outdir, "manifest.json"), "w") as mf:
+        json.dump(summary, mf, indent=1)
+    return summary
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="write synthetic rotated SSH pcaps")
+    ap.add_argument("outdir")
+    ap.add_argument("--benign", type=int, default=50, help="benign interactive sessions")
+    ap.add_argument("--threads", type=int, nargs="*", default=THREAD_STEPS,
+                    help="brute-force stages (concurrent connections each), empty = none")
+    ap.add_argument("--stage-duration", type=float, default=STAGE_DURATION)
+    ap.add_argument("--rotate", type=int, default=ROTATE_SECONDS)
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+    s = generate(a.outdir, a.benign, a.threads, a.stage_duration, a.rotate, a.seed)
+    print(f"[OK] {s['files']} files, {s['packets']} packets, {s['connections']} connections -> {a.outdir}")
+    sys.exit(0)
@@ -12,6 +12,8 @@ DROP_COLS = [
     "fwd packet length min", # big deviation
     "src_ip", 
     "dst_ip",
+    "flow_start",
+    "flow_end",
     "timestamp",
 ]
 
@@ -22,7 +22,7 @@ def assign_label(row):
 own_df['label'] = own_df.apply(assign_label, axis=1)
 
 # Hapus kolom yang tidak dibutuhkan (kalau memang mau disamakan dengan CICIDS)
-own_df = own_df.drop(columns=['src_ip', 'dst_ip', 'timestamp'], errors='ignore')
+own_df = own_df.drop(columns=['src_ip', 'dst_ip', 'flow_start', 'flow_end', 'timestamp'], errors='ignore')
 
 # Gabungkan dataset
 merged_df = pd.concat([cicids_df, own_df], ignore_index=True)
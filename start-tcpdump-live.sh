@@ -0,0 +1,16 @@
+#!/bin/bash
+
+# LIVE MODE: tcpdump writes packets into a FIFO that PCAPWorker reads with
+#   python PCAPWorker.py --live YOUR_PATH/pcap/live.fifo
+# Keep start-tcpdump.sh running as well if you still want rotated files for forensics.
+# RUN THIS SCRIPT IN CRONTAB
+FIFO=/YOUR_PATH/pcap/live.fifo
+[ -p "$FIFO" ] || mkfifo "$FIFO"
+while true; do
+    if ! pgrep -f "tcpdump.*-w $FIFO" > /dev/null; then
+        echo "$(date) - live tcpdump not running, starting..." >> /home/pros/pcap/log/tcpdump_watchdog.log
+        tcpdump -i enp0s8 -U -n -s 0 -w "$FIFO" 'tcp port 22' \
+            >> /YOUR_PATH/pcap/log/tcpdump_live.log 2>&1 < /dev/null &
+    fi
+    sleep 5 # cek tiap 5 detik
+done &